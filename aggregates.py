@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+from data_processing import (ENERGY_TYPES, FUEL_TOTAL_COLUMNS, energy_proportions,
+                             melt_dataframe, rate_of_change)
+
+class EnergyAggregates:
+    """Per-year, per-region and per-fuel aggregates of the preprocessed
+    dataframe, computed once so callbacks only do dictionary lookups"""
+
+    def __init__(self, df: "pandas.DataFrame"):
+        self.years = sorted(df["Year"].unique())
+        self.regions = list(df["Name"].unique())
+
+        # United Kingdom totals
+        numeric_df = df.drop(columns=["Name", "Unit"])
+        self.uk_totals = numeric_df.groupby("Year").sum()
+        self.uk_totals_df = self.uk_totals.reset_index()
+        self.uk_long = melt_dataframe(self.uk_totals_df)
+        self._uk_year_long = {
+            year: melt_dataframe(self.uk_totals.loc[[year]]) for year in self.years
+        }
+
+        # Per year and per region slices
+        self.region_totals = df.set_index(["Year", "Name"]).sort_index()
+        self.all_regions_df = df.groupby(["Name", "Year"], observed=True).sum(numeric_only=True).reset_index()
+        self._year = {year: year_df for year, year_df in df.groupby("Year")}
+        self._year_long = {
+            year: melt_dataframe(year_df) for year, year_df in self._year.items()
+        }
+        self._region = {name: region_df for name, region_df in df.groupby("Name", observed=True)}
+        self._region_long = {
+            name: melt_dataframe(region_df) for name, region_df in self._region.items()
+        }
+        self._region_year = {
+            key: region_year_df for key, region_year_df in df.groupby(["Name", "Year"], observed=True)
+        }
+        self._region_year_long = {
+            key: melt_dataframe(region_year_df.drop(columns=["Name"]).set_index("Year"))
+            for key, region_year_df in self._region_year.items()
+        }
+
+        # Share of each fuel in every region's consumption
+        self._proportions = {
+            year: proportions_df.reset_index(drop=True)
+            for year, proportions_df in energy_proportions(df).groupby("Year")
+        }
+
+        # Change in consumption since the first year, summed and compounded
+        self._rate_of_change = {
+            compounded: {
+                name: change_df.reset_index(drop=True)
+                for name, change_df in rate_of_change(df, compounded).groupby("Name", observed=True)
+            }
+            for compounded in (False, True)
+        }
+
+        # Global maxima and minima used for axis ranges
+        self.max_uk_total = self.uk_totals["All_Fuels_Total"].max()
+        self.max_region_total = self.region_totals["All_Fuels_Total"].max()
+        region_all_fuels = df.groupby("Name", observed=True)["All_Fuels_Total"]
+        self._region_max = region_all_fuels.max().to_dict()
+        self._region_min = region_all_fuels.min().to_dict()
+
+    def uk_year_long(self, year):
+        """Long dataframe of UK consumption per energy type for one year"""
+        return self._uk_year_long[year]
+
+    def year(self, year):
+        return self._year[year]
+
+    def year_long(self, year):
+        return self._year_long[year]
+
+    def region(self, location):
+        return self._region[location]
+
+    def region_long(self, location):
+        return self._region_long[location]
+
+    def region_year(self, location, year):
+        return self._region_year[(location, year)]
+
+    def region_year_long(self, location, year):
+        return self._region_year_long[(location, year)]
+
+    def region_max(self, location):
+        return self._region_max[location]
+
+    def region_min(self, location):
+        return self._region_min[location]
+
+    def proportions_long(self, year):
+        """Long dataframe of each fuel's share (%) of every region's total"""
+        return self._proportions[year]
+
+    def rate_of_change_long(self, location, compounded=False):
+        """Long dataframe of the % change per energy type since the first year"""
+        return self._rate_of_change[compounded][location]
+
+    def compact(self, decimals=1) -> dict:
+        """JSON-ready fuel totals per year of the UK and of every region,
+        in ENERGY_TYPES order, for rendering small charts in the browser"""
+        def rows(totals):
+            return {
+                str(year): [round(float(value), decimals) for value in values]
+                for year, values in zip(totals.index, totals[FUEL_TOTAL_COLUMNS].to_numpy())
+            }
+        return {
+            "years": [int(year) for year in self.years],
+            "energy_types": ENERGY_TYPES,
+            "uk": rows(self.uk_totals),
+            "regions": {
+                name: rows(region_df.set_index("Year"))
+                for name, region_df in self._region.items()
+            },
+            "region_max": {name: float(value) for name, value in self._region_max.items()},
+        }
+
+class LocalAuthorityAggregates:
+    """Per-region and per-year slices of the local authority dataframe
+
+    `regions` maps each LAUA code to the name of the region containing it,
+    the hierarchy the region drill-down is built on.
+    """
+
+    def __init__(self, df: "pandas.DataFrame", regions: dict):
+        df = df.assign(Region=df["Code"].map(regions).astype("category"))
+        self._codes = {
+            region: sorted(region_df["Code"].unique())
+            for region, region_df in df.groupby("Region", observed=True)
+        }
+        # Largest consumers first, the order the bar chart shows them in
+        self._region_year = {
+            key: region_year_df.sort_values("All_Fuels_Total", ascending=False)
+            for key, region_year_df in df.groupby(["Region", "Year"], observed=True)
+        }
+        self._region_year_long = {
+            key: melt_dataframe(region_year_df)
+            for key, region_year_df in self._region_year.items()
+        }
+        self._region_max = df.groupby("Region", observed=True)["All_Fuels_Total"].max().to_dict()
+
+    def codes(self, region):
+        """LAUA codes of the local authorities in a region"""
+        return self._codes[region]
+
+    def region_year(self, region, year):
+        return self._region_year[(region, year)]
+
+    def region_year_long(self, region, year):
+        return self._region_year_long[(region, year)]
+
+    def region_max(self, region):
+        return self._region_max[region]
+
+class YearPrefixSums:
+    """Cumulative sums over the years of every region and fuel column, so
+    the total or mean of any year range is a difference of two rows"""
+
+    def __init__(self, df: "pandas.DataFrame"):
+        self.years = np.array(sorted(df["Year"].unique()))
+        self.regions = sorted(df["Name"].unique())
+        self.columns = [col for col in df.columns if col not in ("Name", "Year", "Unit")]
+
+        # (region, year, column), years a region has no row for count as zero
+        index = pd.MultiIndex.from_product([self.regions, self.years], names=["Name", "Year"])
+        values = (df.groupby(["Name", "Year"], observed=True)[self.columns].sum()
+                  .reindex(index, fill_value=0).to_numpy("float64")
+                  .reshape(len(self.regions), len(self.years), len(self.columns)))
+        self._cumsum = np.zeros((len(self.regions), len(self.years) + 1, len(self.columns)))
+        np.cumsum(values, axis=1, out=self._cumsum[:, 1:])
+        self._uk_cumsum = self._cumsum.sum(axis=0)
+
+    def _span(self, first, last):
+        return (np.searchsorted(self.years, first, "left"),
+                np.searchsorted(self.years, last, "right"))
+
+    def year_count(self, first, last) -> int:
+        start, stop = self._span(first, last)
+        return int(stop - start)
+
+    def totals(self, first, last, mean=False) -> "pandas.DataFrame":
+        """Sum (or yearly mean) of every column per region over the years
+        `first` to `last` inclusive, in the wide layout of the dataset"""
+        start, stop = self._span(first, last)
+        values = self._cumsum[:, stop] - self._cumsum[:, start]
+        if mean:
+            values = values / max(stop - start, 1)
+        totals_df = pd.DataFrame(values, columns=self.columns)
+        totals_df.insert(0, "Name", self.regions)
+        return totals_df
+
+    def uk_totals(self, first, last, mean=False) -> "pandas.Series":
+        start, stop = self._span(first, last)
+        values = self._uk_cumsum[stop] - self._uk_cumsum[start]
+        if mean:
+            values = values / max(stop - start, 1)
+        return pd.Series(values, index=self.columns)
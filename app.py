@@ -1,46 +1,70 @@
 import datetime
-import json
+import functools
+import glob
+import hashlib
+import os
 
 import dash
 import dash_table
+import flask
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output, State
 import plotly.express as px
 import plotly
-import pandas as pd
 
-from data_processing import preprocess_dataframe, melt_dataframe, construct_regional_geojson, click_location, construct_regional_markdown
+from data_processing import melt_dataframe, click_location, map_click_location, construct_regional_markdown
 import data_processing as dp
 import plotting
+import dataset
+from geometry import SIMPLIFIED_DIR
+from figure_cache import FigureCache
+from http_cache import ResponseCache
+from profiling import CallbackProfiler
+import query_api
 import markdown
 
 DEBUG=True
-
-df = pd.read_csv("Subnational_total_final_energy_consumption_statistics.csv")
-dff = preprocess_dataframe(df)
-with open("nuts_level_1.geojson") as injson:
-    geojson = json.load(injson)
-with open("uk.geojson") as injson:
-    uk_geojson = json.load(injson)
-min_year, max_year = dff['Year'].min(), dff['Year'].max()
-year_marks = {str(year): str(year)
-              for year in dff['Year'].unique()}
-
-
+PROFILE_CALLBACKS = os.environ.get("PROFILE_CALLBACKS") == "1"
+# Hover-driven headers and small charts are rendered in the browser from
+# AGGREGATES_STORE_ID, see assets/clientside.js
+CLIENTSIDE_RENDERING = os.environ.get("CLIENTSIDE_RENDERING", "1") == "1"
+CLIENTSIDE_NAMESPACE = "energy"
+AGGREGATES_STORE_ID = "clientside-aggregates"
+# The parts of the plotly template the clientside bar and pie charts use
+CLIENTSIDE_TEMPLATE_TRACES = ["bar", "pie"]
+CLIENTSIDE_TEMPLATE_LAYOUT = ["autotypenumbers", "colorway", "font", "hovermode", "hoverlabel",
+                              "paper_bgcolor", "plot_bgcolor", "xaxis", "yaxis", "title"]
+UK_BAR_RANGE = [0, 750000]
+RANGE_STATISTICS = ["Total", "Yearly average"]
+CALLBACK_METRICS_FPATH = "callback_metrics.json"
+FIGURE_BUNDLE_FPATH = "figure_bundle.pkl.gz"
+FIGURE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+QUERY_API_PATH = "/api/energy"
+LOCATE_API_PATH = "/api/locate"
+
+figure_cache = FigureCache(FIGURE_CACHE_MAX_BYTES)
+
+def hover_key(location, hoverData):
+    return location, click_location(hoverData)
+
+
+@figure_cache.memoize()
 def update_choropleth():
-    total_uk_df = dff.groupby("Year").sum().reset_index()
+    total_uk_df = dataset.aggregates().uk_totals_df.copy()
     total_uk_df["Name"] = "United Kingdom"
-    fig = px.choropleth_mapbox(total_uk_df, geojson=uk_geojson, locations="Name", color="All_Fuels_Total", featureidkey="properties.union",
-                               animation_frame="Year", color_continuous_scale=plotly.colors.diverging.Temps, range_color=[1000000, 2000000])
+    fig = plotting.animated_choropleth_mapbox(total_uk_df, geojson=dataset.uk_geojson(), locations="Name", color="All_Fuels_Total", featureidkey="properties.union",
+                                              animation_frame="Year", color_continuous_scale=plotly.colors.diverging.Temps, range_color=[1000000, 2000000])
     fig.update_layout(mapbox_style="carto-positron",
-                      mapbox_zoom=3.3, mapbox_center={"lat": 54.7, "lon": -3.43})
+                      mapbox_zoom=plotting.UK_MAPBOX_ZOOM, mapbox_center={"lat": 54.7, "lon": -3.43})
     fig.update_layout(plotting.CHOROPLETH_COLORS)
     return fig
 
 
+@figure_cache.memoize()
 def uk_total_time_series():
-    total_uk_df = dff.groupby("Year").sum().reset_index()
+    total_uk_df = dataset.aggregates().uk_totals_df
     fig = px.line(
         total_uk_df,
         x="Year",
@@ -58,13 +82,13 @@ def uk_total_time_series():
     return fig
 
 
+@figure_cache.memoize()
 def uk_total_per_energy_source():
     min_y = 0
-    total_uk_df = dff.groupby("Year").sum().reset_index()
-    max_y = int(total_uk_df['All_Fuels_Total'].max())
+    max_y = int(dataset.aggregates().max_uk_total)
     max_y = max_y + max_y*.05
 
-    long_year_df = melt_dataframe(total_uk_df)
+    long_year_df = dataset.aggregates().uk_long
     fig = px.bar(
         long_year_df,
         x="Year",
@@ -81,8 +105,9 @@ def uk_total_per_energy_source():
     return fig
 
 
+@figure_cache.memoize()
 def all_regional_line_plot():
-    all_regions_df = dff.groupby(["Name", "Year"]).sum().reset_index()
+    all_regions_df = dataset.aggregates().all_regions_df
     fig = px.line(
         all_regions_df,
         x="Year",
@@ -100,490 +125,702 @@ def all_regional_line_plot():
 
 external_stylesheets = ['https://maxcdn.bootstrapcdn.com/bootstrap/4.0.0/css/bootstrap.min.css']
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+def figure_cache_stats():
+    return figure_cache.stats()
+
+@functools.lru_cache(maxsize=None)
+def figures_version() -> str:
+    """Hash of the dataset, the code and the geometry every figure is
+    drawn from, identifying the prerendered bundle that can be served"""
+    sha = hashlib.sha256(dataset.version().encode())
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    patterns = ["*.py", "*.geojson", os.path.join("assets", "*"), os.path.join(SIMPLIFIED_DIR, "*")]
+    for fpath in sorted(fpath for pattern in patterns for fpath in glob.glob(os.path.join(app_dir, pattern))):
+        sha.update(os.path.relpath(fpath, app_dir).encode())
+        sha.update(dp.file_hash(fpath).encode())
+    sha.update(dp.FUEL_DTYPE.encode())
+    return sha.hexdigest()
+
+if os.path.exists(FIGURE_BUNDLE_FPATH):
+    figure_cache.defer_bundle(FIGURE_BUNDLE_FPATH, figures_version)
+
+@functools.lru_cache(maxsize=None)
+def release(clientside: bool = CLIENTSIDE_RENDERING) -> str:
+    """Hash of the figures and the settings shaping every response, see
+    http_cache.py"""
+    sha = hashlib.sha256(figures_version().encode())
+    sha.update(f"{clientside}".encode())
+    return sha.hexdigest()
+
+def warm():
+    """Loads the data, the figure bundle and the layout ahead of the first
+    request"""
+    dataset.warm()
+    figure_cache.load_deferred_bundle()
+    serve_layout(CLIENTSIDE_RENDERING)
+
+def memory_report():
+    """Memory footprint of this worker, see dataset.memory_report"""
+    report = dataset.memory_report()
+    stats = figure_cache.stats()
+    report["figure_cache_bytes"] = stats["bytes"] + stats["pinned_bytes"]
+    report["figure_cache_pinned_bytes"] = stats["pinned_bytes"]
+    return report
+
+def energy_query():
+    """Read-only JSON query API, see query_api.py"""
+    try:
+        return flask.jsonify(dataset.query_index().query(**query_api.parse_args(flask.request.args)))
+    except query_api.QueryError as error:
+        return flask.jsonify(error=str(error)), 400
+
+def locate_point():
+    """Region and local authority containing the lat/lon of the query string"""
+    try:
+        lat, lon = float(flask.request.args["lat"]), float(flask.request.args["lon"])
+    except (KeyError, ValueError):
+        return flask.jsonify(error="lat and lon must be numbers"), 400
+    code = dataset.laua_index().locate(lon, lat)
+    # NUTS boundaries follow the coastline and exclude estuaries the local
+    # authorities extend over
+    region = dataset.region_index().locate(lon, lat)
+    if region is None and code is not None:
+        region = dataset.laua_regions()[code]
+    return flask.jsonify(
+        lat=lat, lon=lon, region=region, laua=code,
+        laua_name=dataset.laua_index().properties(code)["lau118nm"] if code is not None else None,
+    )
 
-if not DEBUG:
-    server = app.server
+@functools.lru_cache(maxsize=None)
+def clientside_aggregates() -> dict:
+    """Everything the clientside callbacks need to draw, shipped once with
+    the layout"""
+    data = dataset.aggregates().compact()
+    data["colors"] = plotting.ENERGY_SOURCE_COLORS
+    data["plot_colors"] = plotting.PLOT_COLORS
+    template = plotly.io.templates[plotly.io.templates.default].to_plotly_json()
+    data["template"] = {
+        "data": {key: template["data"][key] for key in CLIENTSIDE_TEMPLATE_TRACES},
+        "layout": {key: template["layout"][key] for key in CLIENTSIDE_TEMPLATE_LAYOUT
+                   if key in template["layout"]},
+    }
+    data["uk_range_y"] = UK_BAR_RANGE
+    return data
 
 
 ############################# LAYOUT #############################
 
-app.layout = html.Div(children = [
-
-    ############################# UNITED KINGDOM #############################
-    html.Div(
-        children=[
-            html.Div(
-                dcc.Graph(
-                    id="choropleth",
-                    figure=update_choropleth()
-                )
-            ),
-        ]
-    ),
-    html.Div(
-        children = [
-            html.H1("United Kingdom Energy Consumption", style={"font-size": "6vh", "text-align": "center"}),
-            dcc.Markdown(markdown.INTRO),
-            html.Hr(),
-            # html.H1("United Kingdom", style={"font-size": "6vh", "text-align": "center"}),
-            html.Div(
-                children=[
-                    html.Div(
+@functools.lru_cache(maxsize=None)
+def serve_layout(clientside: bool = CLIENTSIDE_RENDERING):
+    """Builds the layout on the first page load rather than at import, with
+    the store the clientside callbacks draw from if `clientside`"""
+    aggregates = dataset.aggregates()
+    min_year, max_year = min(aggregates.years), max(aggregates.years)
+    year_marks = dataset.year_marks()
+    return html.Div(children = [
+        *([dcc.Store(id=AGGREGATES_STORE_ID, data=clientside_aggregates())] if clientside else []),
+
+        ############################# UNITED KINGDOM #############################
+        html.Div(
+            children=[
+                html.Div(
+                    dcc.Graph(
+                        id="choropleth",
+                        figure=update_choropleth()
+                    )
+                ),
+            ]
+        ),
+        html.Div(
+            children = [
+                html.H1("United Kingdom Energy Consumption", style={"font-size": "6vh", "text-align": "center"}),
+                dcc.Markdown(markdown.INTRO),
+                html.Hr(),
+                # html.H1("United Kingdom", style={"font-size": "6vh", "text-align": "center"}),
+                html.Div(
+                    children=[
                         html.Div(
-                            children = [
-                                html.H3("Energy consumption"),
-                                dcc.Markdown("Hover over a data point to analyze breakdown by energy source"),
-                                dcc.Graph(
-                                    id="uk-total-consumption-time-series",
-                                    figure=uk_total_time_series(),
-                                    hoverData={"points":[{"x": 2005}]},
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
-                            className="plot"
+                            html.Div(
+                                children = [
+                                    html.H3("Energy consumption"),
+                                    dcc.Markdown("Hover over a data point to analyze breakdown by energy source"),
+                                    dcc.Graph(
+                                        id="uk-total-consumption-time-series",
+                                        figure=uk_total_time_series(),
+                                        hoverData={"points":[{"x": 2005}]},
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-8"
                         ),
-                        className="col-xl-8"
-                    ),
+                        html.Div(
+                            html.Div(
+                                children=[
+                                    html.H3(id="total-energy-consumption-bar-header"),
+                                    dcc.Graph(
+                                        id='total-energy-consumption-bar-plot',
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-4",
+                        ),
+                    ],
+                    className="row"
+                ),
+                html.Div(
+                    children=[
+                        html.Div(
+                            html.Div(
+                                children=[
+                                    html.H3(
+                                        "Energy consumption per resource"),
+                                    dcc.RadioItems(
+                                        id='total-type-line',
+                                        options=[{'label': i, 'value': i}
+                                                 for i in ['Linear', 'Log']],
+                                        value='Linear',
+                                        labelStyle={'display': 'inline-block'},
+                                    ),
+                                    dcc.Graph(
+                                        id="total-energy-usage",
+                                        hoverData={"points": [{"x": 2005}]},
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    ),
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-8 order-xl-12"
+                        ),
+                        html.Div(
+                            html.Div(
+                                children=[
+                                    html.H3(
+                                        id="total-energy-consumption-circle-header"),
+                                    dcc.Graph(
+                                        id='total-energy-consumption-percent-circle',
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-4 order-xl-1",
+                        ),
+                    ],
+                    className="row"
+                ),
+                # html.Div(
+                #     children=[
+                #         html.H3("Total energy consumption per energy source (GWh)"),
+                #         dcc.Graph(
+                #             figure=uk_total_per_energy_source()
+                #         )
+                #     ],
+                #     className="plot"
+                # ),
+            ],
+            className="container-fluid dash",
+        ),
+
+
+
+        ############################# NUTS LEVEL 1 REGIONS #############################
+        html.Div(
+            children=[
+                html.Div(
+                    dcc.Graph(
+                        id="all-regions-choropleth",
+                        figure=all_regions_choropleth()
+                    )
+                ),
+            ]
+        ),
+        html.Div(
+            children=[
+                html.H1("NUTS Level 1 Statistical Regions", style={"font-size": "6vh", "text-align": "center"}),
+                dcc.Markdown(markdown.NUTS_LEVEL_1),
+                html.Hr(),
+                html.Div(
                     html.Div(
                         html.Div(
                             children=[
-                                html.H3(id="total-energy-consumption-bar-header"),
+                                html.H3("Energy consumption"),
+                                dcc.Markdown(
+                                    "Hover over a data point to analyze breakdown by energy source per region"),
                                 dcc.Graph(
-                                    id='total-energy-consumption-bar-plot',
+                                    id="all-regions-line-plot",
+                                    figure=all_regional_line_plot(),
+                                    hoverData={"points": [{"x": 2005}]},
                                     style={"height": plotting.PLOT_HEIGHT}
                                 )
                             ],
                             className="plot"
                         ),
-                        className="col-xl-4",
+                        className="col-xl-12"
                     ),
-                ],
-                className="row"
-            ),
-            html.Div(
-                children=[
-                    html.Div(
+                    className="row"
+                ),
+                html.Div(
+                    children = [
                         html.Div(
-                            children=[
-                                html.H3(
-                                    "Energy consumption per resource"),
-                                dcc.RadioItems(
-                                    id='total-type-line',
-                                    options=[{'label': i, 'value': i}
-                                             for i in ['Linear', 'Log']],
-                                    value='Linear',
-                                    labelStyle={'display': 'inline-block'},
-                                ),
+                            html.Div(
+                                children=[
+                                    html.H3(id="header-info"),
+                                    dcc.Graph(
+                                        id='total-energy-consumption-bar',
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    ),
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-6",
+                        ),
+                        html.Div(
+                            html.Div(
+                                children = [
+                                    html.H3(id="header-percentage-info"),
+                                    dcc.Graph(
+                                        id='total-energy-consumption-percent',
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    ),
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-6",
+                        ),
+                    ],
+                    className="row"
+                ),
+                html.Hr(),
+                html.H3(id="year-range-header"),
+                dcc.Markdown("Drag the ends of the slider to total or average consumption over a range of years"),
+                html.Div(
+                    children=[
+                        html.Div(
+                            dcc.RangeSlider(
+                                id="year-range-slider",
+                                min=min_year,
+                                max=max_year,
+                                value=[min_year, max_year],
+                                marks=year_marks,
+                                step=None,
+                                allowCross=False
+                            ),
+                            className="col-xl-9"
+                        ),
+                        html.Div(
+                            dcc.RadioItems(
+                                id="year-range-statistic",
+                                options=[{"label": i, "value": i}
+                                         for i in RANGE_STATISTICS],
+                                value="Total",
+                                labelStyle={"display": "inline-block"},
+                            ),
+                            className="col-xl-3"
+                        ),
+                    ],
+                    className="row"
+                ),
+                html.Div(
+                    children=[
+                        html.Div(
+                            html.Div(
+                                dcc.Graph(id="year-range-choropleth"),
+                                className="plot"
+                            ),
+                            className="col-xl-6",
+                        ),
+                        html.Div(
+                            html.Div(
                                 dcc.Graph(
-                                    id="total-energy-usage",
-                                    hoverData={"points": [{"x": 2005}]},
+                                    id="year-range-pie",
                                     style={"height": plotting.PLOT_HEIGHT}
                                 ),
-                            ],
-                            className="plot"
+                                className="plot"
+                            ),
+                            className="col-xl-6",
                         ),
-                        className="col-xl-8 order-xl-12"
-                    ),
+                    ],
+                    className="row"
+                ),
+                html.Div(
                     html.Div(
                         html.Div(
-                            children=[
-                                html.H3(
-                                    id="total-energy-consumption-circle-header"),
-                                dcc.Graph(
-                                    id='total-energy-consumption-percent-circle',
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
+                            dcc.Graph(
+                                id="year-range-bar",
+                                style={"height": plotting.PLOT_HEIGHT}
+                            ),
                             className="plot"
                         ),
-                        className="col-xl-4 order-xl-1",
+                        className="col-xl-12"
                     ),
-                ],
-                className="row"
-            ),
-            # html.Div(
-            #     children=[
-            #         html.H3("Total energy consumption per energy source (GWh)"),
-            #         dcc.Graph(
-            #             figure=uk_total_per_energy_source()
-            #         )
-            #     ],
-            #     className="plot"
-            # ),
-        ],
-        className="container-fluid dash",
-    ),
-
-
-
-    ############################# NUTS LEVEL 1 REGIONS #############################
-    html.Div(
-        children=[
-            html.Div(
+                    className="row"
+                ),
+                # html.Div(
+                #     html.Div(
+                #         dcc.Slider(
+                #             id='total-energy-consumption-year-slider',
+                #             min=dff['Year'].min(),
+                #             max=dff['Year'].max(),
+                #             value=dff['Year'].min(),
+                #             marks={str(year): str(year)
+                #                 for year in dff['Year'].unique()},
+                #             step=None,
+                #         ),
+                #         className="col-xl-12"
+                #     ),
+                #     className="row"
+                # ),
+            ],
+            className="container-fluid dash",
+        ),
+
+
+
+        ############################# REGION #############################
+        html.Div(
+            children = [
                 dcc.Graph(
-                    id="all-regions-choropleth",
-                )
-            ),
-            dcc.Slider(
-                id='choropleth-year-slider',
-                min=min_year,
-                max=max_year,
-                value=min_year,
-                marks=year_marks,
-                step=None,
-            ),
-        ]
-    ),
-    html.Div(
-        children=[
-            html.H1("NUTS Level 1 Statistical Regions", style={"font-size": "6vh", "text-align": "center"}),
-            dcc.Markdown(markdown.NUTS_LEVEL_1),
-            html.Hr(),
-            html.Div(
+                    id="region-choropleth"
+                ),
+                dcc.Slider(
+                    id='region-choropleth-year-slider',
+                    min=min_year,
+                    max=max_year,
+                    value=min_year,
+                    marks=year_marks,
+                    step=None,
+                ),
+            ]
+        ),
+        html.H1(id="region-info",
+                style={"font-size": "6vh", "text-align": "center"}),
+        html.Div(
+            children=[
+                dcc.Markdown(id="regional-markdown"),
+                dcc.Markdown(
+                    "**Select a different region to visualize that regions data:**"),
                 html.Div(
-                    html.Div(
-                        children=[
-                            html.H3("Energy consumption"),
-                            dcc.Markdown(
-                                "Hover over a data point to analyze breakdown by energy source per region"),
-                            dcc.Graph(
-                                id="all-regions-line-plot",
-                                figure=all_regional_line_plot(),
-                                hoverData={"points": [{"x": 2005}]},
-                                style={"height": plotting.PLOT_HEIGHT}
-                            )
-                        ],
-                        className="plot"
+                    dcc.Dropdown(
+                        id='region-dropdown',
+                        options=[{"label": val, "value": val}
+                                 for val in aggregates.regions],
+                        value='Wales',
+                        clearable=False
                     ),
-                    className="col-xl-12"
+                    style={"width": "200px", "margin-bottom": "2%"}
                 ),
-                className="row"
-            ),
-            html.Div(
-                children = [
-                    html.Div(
+                html.Hr(),
+                html.Div(
+                    children=[
                         html.Div(
-                            children=[
-                                html.H3(id="header-info"),
-                                dcc.Graph(
-                                    id='total-energy-consumption-bar',
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                ),
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.H3("Energy consumption"),
+                                    dcc.Markdown(
+                                        "Hover over a data point to analyze breakdown by energy source"),
+                                    dcc.Graph(
+                                        id="region-consumption-time-series",
+                                        hoverData={"points": [{"x": 2005}]},
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-8"
                         ),
-                        className="col-xl-6",
-                    ),
-                    html.Div(
                         html.Div(
-                            children = [
-                                html.H3(id="header-percentage-info"),
-                                dcc.Graph(
-                                    id='total-energy-consumption-percent',
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                ),
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.H3(
+                                        id="region-consumption-bar-header"),
+                                    dcc.Graph(
+                                        id='region-consumption-bar-plot',
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-4",
                         ),
-                        className="col-xl-6",
-                    ),
-                ],
-                className="row"
-            ),
-            # html.Div(
-            #     html.Div(
-            #         dcc.Slider(
-            #             id='total-energy-consumption-year-slider',
-            #             min=dff['Year'].min(),
-            #             max=dff['Year'].max(),
-            #             value=dff['Year'].min(),
-            #             marks={str(year): str(year)
-            #                 for year in dff['Year'].unique()},
-            #             step=None,
-            #         ),
-            #         className="col-xl-12"
-            #     ),
-            #     className="row"
-            # ),
-        ],
-        className="container-fluid dash",
-    ),
-
-
-
-    ############################# REGION #############################
-    html.Div(
-        children = [
-            dcc.Graph(
-                id="region-choropleth"
-            ),
-            dcc.Slider(
-                id='region-choropleth-year-slider',
-                min=dff['Year'].min(),
-                max=dff['Year'].max(),
-                value=dff['Year'].min(),
-                marks={str(year): str(year)
-                       for year in dff['Year'].unique()},
-                step=None,
-            ),
-        ]
-    ),
-    html.H1(id="region-info",
-            style={"font-size": "6vh", "text-align": "center"}),
-    html.Div(
-        children=[
-            dcc.Markdown(id="regional-markdown"),
-            dcc.Markdown(
-                "**Select a different region to visualize that regions data:**"),
-            html.Div(
-                dcc.Dropdown(
-                    id='region-dropdown',
-                    options=[{"label": val, "value": val}
-                             for val in dff["Name"].unique()],
-                    value='Wales',
-                    clearable=False
+                    ],
+                    className="row"
                 ),
-                style={"width": "200px", "margin-bottom": "2%"}
-            ),
-            html.Hr(),
-            html.Div(
-                children=[
-                    html.Div(
+                html.Div(
+                    children=[
                         html.Div(
-                            children=[
-                                html.H3("Energy consumption"),
-                                dcc.Markdown(
-                                    "Hover over a data point to analyze breakdown by energy source"),
-                                dcc.Graph(
-                                    id="region-consumption-time-series",
-                                    hoverData={"points": [{"x": 2005}]},
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.H3("Energy consumption per resource"),
+                                    dcc.RadioItems(
+                                        id='yaxis-type-line',
+                                        options=[{'label': i, 'value': i}
+                                                for i in ['Linear', 'Log']],
+                                        value='Linear',
+                                        labelStyle={'display': 'inline-block'}
+                                    ),
+                                    dcc.Graph(
+                                        id="region-time-series-scatter",
+                                        hoverData={"points": [{"x": 2005}]},
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    ),
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-8 order-xl-12"
                         ),
-                        className="col-xl-8"
-                    ),
-                    html.Div(
                         html.Div(
-                            children=[
-                                html.H3(
-                                    id="region-consumption-bar-header"),
-                                dcc.Graph(
-                                    id='region-consumption-bar-plot',
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.H3(
+                                        id="region-energy-consumption-circle-header"),
+                                    dcc.Graph(
+                                        id='region-energy-consumption-percent-circle',
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-4 order-xl-1",
                         ),
-                        className="col-xl-4",
-                    ),
-                ],
-                className="row"
-            ),
-            html.Div(
-                children=[
-                    html.Div(
+                    ],
+                    className="row"
+                ),
+                html.Div(
+                    children=[
                         html.Div(
-                            children=[
-                                html.H3("Energy consumption per resource"),
-                                dcc.RadioItems(
-                                    id='yaxis-type-line',
-                                    options=[{'label': i, 'value': i}
-                                            for i in ['Linear', 'Log']],
-                                    value='Linear',
-                                    labelStyle={'display': 'inline-block'}
-                                ),
-                                dcc.Graph(
-                                    id="region-time-series-scatter",
-                                    hoverData={"points": [{"x": 2005}]},
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                ),
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.H3("Local authorities"),
+                                    dcc.Graph(
+                                        id="laua-choropleth",
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    ),
+                                    dcc.Slider(
+                                        id='laua-year-slider',
+                                        min=min_year,
+                                        max=max_year,
+                                        value=max_year,
+                                        marks=year_marks,
+                                        step=None,
+                                    ),
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-6"
                         ),
-                        className="col-xl-8 order-xl-12"
-                    ),
-                    html.Div(
                         html.Div(
-                            children=[
-                                html.H3(
-                                    id="region-energy-consumption-circle-header"),
-                                dcc.Graph(
-                                    id='region-energy-consumption-percent-circle',
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.H3(id="laua-bar-header"),
+                                    dcc.Graph(
+                                        id='laua-bar-plot',
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-6",
                         ),
-                        className="col-xl-4 order-xl-1",
-                    ),
-                ],
-                className="row"
-            ),
-
-
-
-            # html.Div(
-            #     children = [
-            #         html.Div(
-            #             html.Div(
-            #                 children=[
-            #                     html.H3("Total consumption per year"),
-            #                     dcc.Graph(
-            #                         id="region-time-series-bar",
-            #                     )
-            #                 ],
-            #                 className="plot"
-            #             ),
-            #             className="col-xl-6",
-            #         ),
-            #         html.Div(
-            #             html.Div(
-            #                 children = [
-            #                     html.H3("Energy source consumption per year"),
-            #                     dcc.RadioItems(
-            #                         id='yaxis-type-line',
-            #                         options=[{'label': i, 'value': i}
-            #                                 for i in ['Linear', 'Log']],
-            #                         value='Linear',
-            #                         labelStyle={'display': 'inline-block'}
-            #                     ),
-            #                     dcc.Graph(
-            #                         id="region-time-series-scatter",
-            #                     ),
-            #                 ],
-            #                 className="plot"
-            #             ),
-            #             className="col-xl-6"
-            #         ),
-            #     ],
-            #     className="row"
-            # ),
-            # html.Div(
-            #     html.Div(
-            #         html.Div(
-            #             children = [
-            #                 html.H3("Cumulative rate of change per energy source"),
-            #                 dcc.Graph(
-            #                     id="cum-rate-of-change",
-            #                 ),
-            #             ],
-            #             className="plot"
-            #         ),
-            #         className="col-xl-12"
-            #     ),
-            #     className="row"
-            # ),
-            # html.Div(
-            #     html.Div(
-            #         children=[
-            #             html.H3("Energy resource usage by the numbers"),
-            #             html.Div(
-            #                 dash_table.DataTable(
-            #                     id="table",
-            #                     data=[],
-            #                     style_cell={'textAlign': 'center'},
-            #                     style_data_conditional=[
-            #                         {
-            #                             'if': {
-            #                                 'column_id': 'Year',
-            #                             },
-            #                             'fontWeight': 'bold',
-            #                             'backgroundColor': '#e8e8e8',
-            #                         },
-            #                     ]
-            #                 ),
-            #             )
-            #         ],
-            #         className="col-xl-12"
-            #     ),
-            #     className="row",
-            #     style={"margin-top": "3%"}
-            # ),
-        ],
-        className="container-fluid dash",
-    )
-])
+                    ],
+                    className="row"
+                ),
+
+
+
+                # html.Div(
+                #     children = [
+                #         html.Div(
+                #             html.Div(
+                #                 children=[
+                #                     html.H3("Total consumption per year"),
+                #                     dcc.Graph(
+                #                         id="region-time-series-bar",
+                #                     )
+                #                 ],
+                #                 className="plot"
+                #             ),
+                #             className="col-xl-6",
+                #         ),
+                #         html.Div(
+                #             html.Div(
+                #                 children = [
+                #                     html.H3("Energy source consumption per year"),
+                #                     dcc.RadioItems(
+                #                         id='yaxis-type-line',
+                #                         options=[{'label': i, 'value': i}
+                #                                 for i in ['Linear', 'Log']],
+                #                         value='Linear',
+                #                         labelStyle={'display': 'inline-block'}
+                #                     ),
+                #                     dcc.Graph(
+                #                         id="region-time-series-scatter",
+                #                     ),
+                #                 ],
+                #                 className="plot"
+                #             ),
+                #             className="col-xl-6"
+                #         ),
+                #     ],
+                #     className="row"
+                # ),
+                # html.Div(
+                #     html.Div(
+                #         html.Div(
+                #             children = [
+                #                 html.H3("Cumulative rate of change per energy source"),
+                #                 dcc.Graph(
+                #                     id="cum-rate-of-change",
+                #                 ),
+                #             ],
+                #             className="plot"
+                #         ),
+                #         className="col-xl-12"
+                #     ),
+                #     className="row"
+                # ),
+                # html.Div(
+                #     html.Div(
+                #         children=[
+                #             html.H3("Energy resource usage by the numbers"),
+                #             html.Div(
+                #                 dash_table.DataTable(
+                #                     id="table",
+                #                     data=[],
+                #                     style_cell={'textAlign': 'center'},
+                #                     style_data_conditional=[
+                #                         {
+                #                             'if': {
+                #                                 'column_id': 'Year',
+                #                             },
+                #                             'fontWeight': 'bold',
+                #                             'backgroundColor': '#e8e8e8',
+                #                         },
+                #                     ]
+                #                 ),
+                #             )
+                #         ],
+                #         className="col-xl-12"
+                #     ),
+                #     className="row",
+                #     style={"margin-top": "3%"}
+                # ),
+            ],
+            className="container-fluid dash",
+        )
+    ])
 
 ############################# CALLBACKS #############################
 
+CALLBACKS = []
+
+def callback(*args, clientside=None, **kwargs):
+    """Records a callback to be registered on each app `create_app` builds
+
+    `clientside` names the equivalent function in assets/clientside.js,
+    which is registered instead when rendering clientside. It receives the
+    callback's inputs followed by the aggregates store.
+    """
+    def decorator(func):
+        CALLBACKS.append((args, kwargs, func, clientside))
+        return func
+    return decorator
+
 ############################# HEADERS #############################
 
 
-@app.callback(
+@callback(
     Output('region-energy-consumption-circle-header', 'children'),
-    Input('region-time-series-scatter', 'hoverData')
+    Input('region-time-series-scatter', 'hoverData'),
+    clientside="percentageHeader"
 )
 def update_circle_header(hoverData):
     year_value = hoverData['points'][0]['x']
     return f"Energy consumption (%) ({year_value})"
 
-@app.callback(
+@callback(
     Output('uk-circle-percentage-info', 'children'),
-    Input('total-energy-consumption-year-slider', 'value')
+    Input('total-energy-consumption-year-slider', 'value'),
+    clientside="ukCircleHeader"
 )
 def update_circle_header(year_value):
     return f"Aggregate resource usage in the UK ({year_value})"
 
-@app.callback(
+@callback(
     Output("total-energy-consumption-bar-header", "children"),
-    Input("uk-total-consumption-time-series", "hoverData")
+    Input("uk-total-consumption-time-series", "hoverData"),
+    clientside="consumptionHeader"
 )
 def update_consumption_bar_plot(hoverData):
     year_value = hoverData['points'][0]['x']
     return f"Energy consumption ({year_value})"
 
-@app.callback(
+@callback(
     Output("region-consumption-bar-header", "children"),
-    Input('region-consumption-time-series', 'hoverData')
+    Input('region-consumption-time-series', 'hoverData'),
+    clientside="consumptionHeader"
 )
 def update_region_consumption_bar_plot(hoverData):
     year_value = hoverData['points'][0]['x']
     return f"Energy consumption ({year_value})"
 
-@app.callback(
+@callback(
     Output("total-energy-consumption-circle-header", "children"),
-    Input("total-energy-usage", "hoverData")
+    Input("total-energy-usage", "hoverData"),
+    clientside="percentageHeader"
 )
 def update_percent_circle_header(hoverData):
     year_value = hoverData['points'][0]['x']
     return f"Energy consumption (%) ({year_value})"
 
-@app.callback(
+@callback(
     Output('header-info', 'children'),
-    Input('all-regions-line-plot', 'hoverData')
+    Input('all-regions-line-plot', 'hoverData'),
+    clientside="consumptionHeader"
 )
 def update_header(hoverData):
     year_value = hoverData['points'][0]['x']
     return f"Energy consumption ({year_value})"
 
-@app.callback(
+@callback(
     Output('header-percentage-info', 'children'),
-    Input('all-regions-line-plot', 'hoverData')
+    Input('all-regions-line-plot', 'hoverData'),
+    clientside="percentageHeader"
 )
 def update_percentage_header(hoverData):
     year_value = hoverData['points'][0]['x']
     return f"Energy consumption (%) ({year_value})"
 
-@app.callback(
+@callback(
     Output('region-info', 'children'),
-    Input('region-dropdown', 'value')
+    Input('region-dropdown', 'value'),
+    clientside="regionHeader"
 )
 def update_region_bar_header(location):
     return f"{location}"
 
+@callback(
+    Output('laua-bar-header', 'children'),
+    [Input('region-dropdown', 'value'),
+     Input("laua-year-slider", "value")],
+    clientside="lauaBarHeader"
+)
+def update_laua_bar_header(location, year_value):
+    return f"Energy consumption per local authority ({year_value})"
+
 ############################# BAR PLOTS #############################
-@app.callback(
+@callback(
     Output("total-energy-consumption-bar-plot", "figure"),
-    Input("uk-total-consumption-time-series", "hoverData")
+    Input("uk-total-consumption-time-series", "hoverData"),
+    clientside="ukEnergyBar"
 )
+@figure_cache.memoize(key=click_location)
 def total_uk_energy_bar_plot(hoverData):
     year_value = hoverData['points'][0]['x']
-    year_df = dff[dff["Year"] == year_value]
-    year_df = year_df.groupby("Year").sum()
-    long_total_df = melt_dataframe(year_df)
+    long_total_df = dataset.aggregates().uk_year_long(year_value)
     # long_total_df = long_total_df.sort_values(by="Energy type")
     fig = px.bar(
         long_total_df,
@@ -591,20 +828,26 @@ def total_uk_energy_bar_plot(hoverData):
         y="GWh",
         color="Energy type",
         color_discrete_map=plotting.ENERGY_SOURCE_COLORS,
-        range_y=[0, 750000]
+        range_y=UK_BAR_RANGE
     )
     fig.update_layout(plotting.PLOT_COLORS)
     fig.update_xaxes(categoryorder="total ascending")
 
     return fig
 
-@app.callback(
-    Output('total-energy-consumption-percent', 'figure'),
+@callback(
+    [Output('total-energy-consumption-percent', 'figure'),
+     Output('total-energy-consumption-bar', 'figure')],
     Input('all-regions-line-plot', 'hoverData')
 )
+def update_all_regions_year(hoverData):
+    """Both per region charts of the hovered year, in one request"""
+    return update_graph_percent(hoverData), update_graph(hoverData)
+
+@figure_cache.memoize(key=click_location)
 def update_graph_percent(hoverData):
     year_value = hoverData['points'][0]['x']
-    long_adjusted_sum_df = dp.calculate_energy_proportion_df(year_value, dff)
+    long_adjusted_sum_df = dataset.aggregates().proportions_long(year_value)
 
     fig = px.bar(
         long_adjusted_sum_df,
@@ -620,18 +863,14 @@ def update_graph_percent(hoverData):
     fig.update_layout(plotting.PLOT_COLORS)
     return fig
 
-@app.callback(
-    Output('total-energy-consumption-bar', 'figure'),
-    Input('all-regions-line-plot', 'hoverData')
-)
+@figure_cache.memoize(key=click_location)
 def update_graph(hoverData):
     year_value = hoverData['points'][0]['x']
     min_y = 0
-    max_y = int(dff.groupby(["Year", "Name"]).sum().max()['All_Fuels_Total'])
+    max_y = int(dataset.aggregates().max_region_total)
     max_y = max_y + max_y*.05
 
-    year_df = dff[dff["Year"] == year_value]
-    long_year_df = melt_dataframe(year_df)
+    long_year_df = dataset.aggregates().year_long(year_value)
     fig = px.bar(
         long_year_df,
         x="Name",
@@ -644,13 +883,32 @@ def update_graph(hoverData):
     fig.update_layout(plotting.PLOT_COLORS)
     return fig
 
-@app.callback(
+@figure_cache.memoize()
+def year_range_bar(first, last, statistic):
+    """Consumption per region and energy type over a range of years"""
+    totals_df = dataset.prefix_sums().totals(first, last, mean=statistic != "Total")
+    fig = px.bar(
+        melt_dataframe(totals_df),
+        x="Name",
+        y="GWh",
+        color="Energy type",
+        color_discrete_map=plotting.ENERGY_SOURCE_COLORS,
+        labels={"GWh": range_unit(statistic)}
+    )
+    fig.update_xaxes(title_text="", categoryorder="total ascending")
+    fig.update_layout(plotting.PLOT_COLORS)
+    return fig
+
+def range_unit(statistic):
+    return "GWh" if statistic == "Total" else "GWh per year"
+
+@callback(
     Output('region-time-series-bar', 'figure'),
     Input('region-dropdown', 'value')
 )
+@figure_cache.memoize()
 def update_region_bar(location):
-    region_df = dff[dff['Name'] == location]
-    long_region_df = melt_dataframe(region_df)
+    long_region_df = dataset.aggregates().region_long(location)
 
     fig = px.bar(
         long_region_df,
@@ -662,23 +920,35 @@ def update_region_bar(location):
     fig.update_layout(plotting.PLOT_COLORS)
     return fig
 
+@figure_cache.memoize()
+def laua_energy_bar_plot(location, year_value):
+    long_laua_df = dataset.laua_aggregates().region_year_long(location, year_value)
+    fig = px.bar(
+        long_laua_df,
+        x="Name",
+        y="GWh",
+        color="Energy type",
+        color_discrete_map=plotting.ENERGY_SOURCE_COLORS,
+    )
+    fig.update_xaxes(title_text="")
+    fig.update_layout(plotting.PLOT_COLORS)
+    return fig
 
-@app.callback(
+@callback(
     Output('region-consumption-bar-plot', 'figure'),
     [Input('region-dropdown', 'value'),
      Input('region-consumption-time-series', 'hoverData')
-    ]
+    ],
+    clientside="regionEnergyBar"
 )
+@figure_cache.memoize(key=hover_key)
 def region_energy_bar_plot(location, hoverData):
     year_value = hoverData['points'][0]['x']
-    region_df = dff[dff["Name"] == location]
-    year_df = region_df[region_df["Year"] == year_value]
-    year_df = year_df.groupby("Year").sum()
 
     min_y = 0
-    max_y = region_df["All_Fuels_Total"].max()
+    max_y = dataset.aggregates().region_max(location)
 
-    long_total_df = melt_dataframe(year_df)
+    long_total_df = dataset.aggregates().region_year_long(location, year_value)
     fig = px.bar(
         long_total_df,
         x="Energy type",
@@ -693,13 +963,13 @@ def region_energy_bar_plot(location, hoverData):
     return fig
 
 ############################# LINE PLOTS #############################
-@app.callback(
+@callback(
     Output('total-energy-usage', 'figure'),
     Input('total-type-line', 'value'),
 )
+@figure_cache.memoize()
 def total_uk_energy_time_series(yaxis_type):
-    year_df = dff.groupby("Year").sum()
-    long_total_df = melt_dataframe(year_df.reset_index())
+    long_total_df = dataset.aggregates().uk_long
     fig = px.line(
         long_total_df,
         x="Year",
@@ -717,15 +987,12 @@ def total_uk_energy_time_series(yaxis_type):
 
     return fig
 
-@app.callback(
-    Output('region-consumption-time-series', 'figure'),
-    Input('region-dropdown', 'value'),
-)
+@figure_cache.memoize()
 def uk_region_time_series(location):
-    region_df = dff[dff["Name"] == location]
+    region_df = dataset.aggregates().region(location)
 
-    min_y = region_df["All_Fuels_Total"].min() * .625
-    max_y = region_df["All_Fuels_Total"].max()
+    min_y = dataset.aggregates().region_min(location) * .625
+    max_y = dataset.aggregates().region_max(location)
     max_y += max_y * .05
 
     fig = px.line(
@@ -744,14 +1011,9 @@ def uk_region_time_series(location):
 
     return fig
 
-@app.callback(
-    Output('region-time-series-scatter', 'figure'),
-    [Input('region-dropdown', 'value'),
-     Input('yaxis-type-line', 'value')],
-)
+@figure_cache.memoize()
 def update_region_line(location, yaxis_type):
-    region_df = dff[dff['Name'] == location]
-    long_region_df = melt_dataframe(region_df)
+    long_region_df = dataset.aggregates().region_long(location)
 
     fig = px.line(
         long_region_df,
@@ -768,12 +1030,13 @@ def update_region_line(location, yaxis_type):
 
     return fig
 
-@app.callback(
+@callback(
     Output('cum-rate-of-change', 'figure'),
     Input('region-dropdown', 'value')
 )
+@figure_cache.memoize()
 def update_cum_rate_of_change(location):
-    year_change_df = dp.calculate_rate_of_change_df(location, dff)
+    year_change_df = dataset.aggregates().rate_of_change_long(location)
 
     fig = px.line(
         year_change_df,
@@ -792,40 +1055,56 @@ def update_cum_rate_of_change(location):
     return fig
 
 ############################# CHOROPLETHS #############################
-@app.callback(
-    Output('all-regions-choropleth', 'figure'),
-    Input('choropleth-year-slider', 'value')
-)
-def update_all_regions_choropleth(year_value):
-    """Returns choropleth figure showing all regions in the UK"""
-    year_df = dff[dff["Year"] == year_value]
-    fig = px.choropleth_mapbox(year_df, geojson=geojson, locations="Name", color="All_Fuels_Total", featureidkey="properties.nuts118nm",
-                               range_color=(0, 250000), color_continuous_scale=plotly.colors.diverging.Temps)
+@figure_cache.memoize()
+def all_regions_choropleth():
+    """Returns choropleth figure showing all regions in the UK, animated over the years"""
+    all_regions_df = dataset.aggregates().all_regions_df
+    fig = plotting.animated_choropleth_mapbox(all_regions_df, geojson=dataset.nuts_geojson(), locations="Name", color="All_Fuels_Total", featureidkey="properties.nuts118nm",
+                                              animation_frame="Year", range_color=(0, 250000), color_continuous_scale=plotly.colors.diverging.Temps)
     fig.update_layout(mapbox_style="carto-positron",
-                      mapbox_zoom=3.3, mapbox_center={"lat": 54.7, "lon": -3.43})
+                      mapbox_zoom=plotting.UK_MAPBOX_ZOOM, mapbox_center={"lat": 54.7, "lon": -3.43})
     fig.update_layout(plotting.CHOROPLETH_COLORS)
     return fig
 
-@app.callback(
-    Output('region-choropleth', 'figure'),
-    [Input('region-dropdown', 'value'),
-     Input("region-choropleth-year-slider", "value")]
-)
+@figure_cache.memoize()
 def update_region_choropleth(location, year_value):
     """ Returns choropleth figure showing specific region in the UK"""
-    region_df = dff[dff["Name"] == location]
-    year_df = region_df[region_df["Year"] == year_value]
-    region_geojson = construct_regional_geojson(location, geojson)
-    max_energy = region_df["All_Fuels_Total"].max()
+    year_df = dataset.aggregates().region_year(location, year_value)
+    region_geojson = dataset.region_index().collection(location)
+    max_energy = dataset.aggregates().region_max(location)
     fig = px.choropleth_mapbox(year_df, geojson=region_geojson, locations="Name", color="All_Fuels_Total", featureidkey="properties.nuts118nm",
                                range_color=(0, max_energy), color_continuous_scale=plotly.colors.diverging.Temps)
     fig.update_layout(mapbox_style="carto-positron",
-                      mapbox_zoom=3.7, mapbox_center={"lat": region_geojson["features"][0]["properties"]["lat"], "lon": region_geojson["features"][0]["properties"]["long"]})
+                      mapbox_zoom=dataset.region_index().zoom(location), mapbox_center=dataset.region_index().center(location))
+    fig.update_layout(plotting.CHOROPLETH_COLORS)
+    return fig
+
+@figure_cache.memoize()
+def update_laua_choropleth(location, year_value):
+    """ Returns choropleth figure showing the local authorities of a region"""
+    laua_df = dataset.laua_aggregates().region_year(location, year_value)
+    max_energy = dataset.laua_aggregates().region_max(location)
+    fig = px.choropleth_mapbox(laua_df, geojson=dataset.laua_geojson(location), locations="Code", color="All_Fuels_Total",
+                               featureidkey="properties.lau118cd", hover_name="Name",
+                               range_color=(0, max_energy), color_continuous_scale=plotly.colors.diverging.Temps)
+    fig.update_layout(mapbox_style="carto-positron",
+                      mapbox_zoom=dataset.region_index().zoom(location), mapbox_center=dataset.region_index().center(location))
+    fig.update_layout(plotting.CHOROPLETH_COLORS)
+    return fig
+
+@figure_cache.memoize()
+def year_range_choropleth(first, last, statistic):
+    """Consumption of every region over a range of years"""
+    totals_df = dataset.prefix_sums().totals(first, last, mean=statistic != "Total")
+    fig = px.choropleth_mapbox(totals_df, geojson=dataset.nuts_geojson(), locations="Name", color="All_Fuels_Total", featureidkey="properties.nuts118nm",
+                               labels={"All_Fuels_Total": range_unit(statistic)}, color_continuous_scale=plotly.colors.diverging.Temps)
+    fig.update_layout(mapbox_style="carto-positron",
+                      mapbox_zoom=plotting.UK_MAPBOX_ZOOM, mapbox_center={"lat": 54.7, "lon": -3.43})
     fig.update_layout(plotting.CHOROPLETH_COLORS)
     return fig
 
 ############################# PIE CHARTS #############################
-# @app.callback(
+# @callback(
 #     Output("total-energy-consumption-circle", "figure"),
 #     Input("total-energy-consumption-year-slider", "value")
 # )
@@ -836,15 +1115,15 @@ def update_region_choropleth(location, year_value):
 #     fig.update_traces(textposition='inside', textinfo='percent+label')
 #     return fig
 
-@app.callback(
+@callback(
     Output("total-energy-consumption-percent-circle", "figure"),
-    Input("total-energy-usage", "hoverData")
+    Input("total-energy-usage", "hoverData"),
+    clientside="ukPercentCircle"
 )
+@figure_cache.memoize(key=click_location)
 def update_percent_circle(hoverData):
     year_value = hoverData['points'][0]['x']
-    year_df = dff[dff["Year"] == year_value]
-    energy_df = year_df.groupby("Year").sum()
-    melted_energy_df = melt_dataframe(energy_df)
+    melted_energy_df = dataset.aggregates().uk_year_long(year_value)
     fig = px.pie(melted_energy_df, values="GWh", names="Energy type", color="Energy type",
                  hole=.5, color_discrete_map=plotting.ENERGY_SOURCE_COLORS)
     fig.update_layout(plotting.PLOT_COLORS)
@@ -854,17 +1133,16 @@ def update_percent_circle(hoverData):
     return fig
 
 
-@app.callback(
+@callback(
     Output("region-energy-consumption-percent-circle", "figure"),
     [Input('region-dropdown', 'value'),
      Input('region-time-series-scatter', 'hoverData')],
+    clientside="regionPercentCircle"
 )
+@figure_cache.memoize(key=hover_key)
 def update_region_percent_circle(location, hoverData):
     year_value = hoverData['points'][0]['x']
-    region_df = dff[dff["Name"] == location]
-    year_df = region_df[region_df["Year"] == year_value]
-    energy_df = year_df.groupby("Year").sum()
-    melted_energy_df = melt_dataframe(energy_df)
+    melted_energy_df = dataset.aggregates().region_year_long(location, year_value)
     fig = px.pie(melted_energy_df, values="GWh", names="Energy type", color="Energy type",
                  hole=.5, color_discrete_map=plotting.ENERGY_SOURCE_COLORS)
     fig.update_layout(plotting.PLOT_COLORS)
@@ -873,17 +1151,97 @@ def update_region_percent_circle(location, hoverData):
 
     return fig
 
+@figure_cache.memoize()
+def year_range_pie(first, last, statistic):
+    """Share of each energy type in UK consumption over a range of years"""
+    uk_totals = dataset.prefix_sums().uk_totals(first, last, mean=statistic != "Total")
+    fig = px.pie(melt_dataframe(uk_totals.to_frame().T), values="GWh", names="Energy type", color="Energy type",
+                 hole=.5, color_discrete_map=plotting.ENERGY_SOURCE_COLORS,
+                 labels={"GWh": range_unit(statistic)})
+    fig.update_layout(plotting.PLOT_COLORS)
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    fig.update_layout(showlegend=False)
+    return fig
+
 ############################# MARKDOWN #############################
 
-@app.callback(
-    Output('regional-markdown', 'children'),
-    Input('region-dropdown', 'value')
-)
 def update_regional_markdown(location):
     return construct_regional_markdown(location)
 
+############################# REGION #############################
 
-# @app.callback(
+def triggered_ids() -> set:
+    """Ids of the components whose change fired the current callback,
+    empty on the initial call"""
+    return {item["prop_id"].split(".")[0] for item in dash.callback_context.triggered} - {""}
+
+@callback(
+    [Output('region-consumption-time-series', 'figure'),
+     Output('region-time-series-scatter', 'figure'),
+     Output('region-choropleth', 'figure'),
+     Output('laua-choropleth', 'figure'),
+     Output('laua-bar-plot', 'figure'),
+     Output('regional-markdown', 'children')],
+    [Input('region-dropdown', 'value'),
+     Input('yaxis-type-line', 'value'),
+     Input("region-choropleth-year-slider", "value"),
+     Input("laua-year-slider", "value")]
+)
+def update_region(location, yaxis_type, region_year, laua_year):
+    """Every server rendered output of the region section in one request.
+    Only the outputs depending on the inputs that changed are recomputed."""
+    triggered = triggered_ids()
+    def changed(component_id):
+        return not triggered or "region-dropdown" in triggered or component_id in triggered
+    def unless_changed(component_id, func, *args):
+        return func(*args) if changed(component_id) else dash.no_update
+
+    return (
+        unless_changed("region-dropdown", uk_region_time_series, location),
+        unless_changed("yaxis-type-line", update_region_line, location, yaxis_type),
+        unless_changed("region-choropleth-year-slider", update_region_choropleth, location, region_year),
+        unless_changed("laua-year-slider", update_laua_choropleth, location, laua_year),
+        unless_changed("laua-year-slider", laua_energy_bar_plot, location, laua_year),
+        unless_changed("region-dropdown", update_regional_markdown, location),
+    )
+
+@callback(
+    [Output("year-range-header", "children"),
+     Output("year-range-choropleth", "figure"),
+     Output("year-range-bar", "figure"),
+     Output("year-range-pie", "figure")],
+    [Input("year-range-slider", "value"),
+     Input("year-range-statistic", "value")]
+)
+def update_year_range(year_range, statistic):
+    """Per region and UK consumption summed or averaged over the selected
+    years, each read from the prefix sums in two lookups"""
+    first, last = year_range
+    years = str(first) if first == last else f"{first}-{last}"
+    return (
+        f"{statistic} energy consumption ({years})",
+        year_range_choropleth(first, last, statistic),
+        year_range_bar(first, last, statistic),
+        year_range_pie(first, last, statistic),
+    )
+
+@callback(
+    Output('region-dropdown', 'value'),
+    [Input('all-regions-choropleth', 'clickData'),
+     Input('region-choropleth', 'clickData')],
+    State('region-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def select_clicked_region(all_regions_click, region_click, location):
+    """Selects the region clicked on either map"""
+    clickData = all_regions_click if "all-regions-choropleth" in triggered_ids() else region_click
+    clicked = map_click_location(clickData, dataset.region_index()) if clickData else None
+    if clicked is None or clicked == location:
+        return dash.no_update
+    return clicked
+
+
+# @callback(
 #     [Output("table", "data"), Output("table", "columns")],
 #      Input('region-dropdown', 'value')
 # )
@@ -903,5 +1261,44 @@ def update_regional_markdown(location):
 #     return region_df.to_dict("records"), [{"name": i, "id": i} for i in region_df.columns]
 
 
+def create_app(profile=PROFILE_CALLBACKS, clientside=CLIENTSIDE_RENDERING):
+    """Builds the Dash app. Data, geometry and figures are loaded lazily on
+    first use and shared by every app in the process.
+
+    With `profile` every callback is timed, see profiling.py. With
+    `clientside` callbacks that have a clientside equivalent run in the
+    browser.
+    """
+    app = dash.Dash(__name__, external_stylesheets=external_stylesheets,
+                    suppress_callback_exceptions=True)
+    app.layout = functools.partial(serve_layout, clientside)
+    profiler = CallbackProfiler() if profile else None
+    for args, kwargs, func, clientside_function in CALLBACKS:
+        if clientside and clientside_function is not None:
+            app.clientside_callback(
+                ClientsideFunction(CLIENTSIDE_NAMESPACE, clientside_function),
+                *args, State(AGGREGATES_STORE_ID, "data"), **kwargs
+            )
+            continue
+        if profiler is not None:
+            func = profiler.wrap_body(func)
+        app.callback(*args, **kwargs)(func)
+    if profiler is not None:
+        profiler.instrument(app, CALLBACK_METRICS_FPATH)
+    response_cache = ResponseCache(functools.partial(release, clientside), RESPONSE_CACHE_MAX_BYTES,
+                                   on_hit=profiler.record_cache_hit if profiler is not None else None)
+    response_cache.init_app(app.server)
+    app.server.add_url_rule("/_figure-cache", view_func=figure_cache_stats)
+    app.server.add_url_rule("/_response-cache", view_func=response_cache.stats)
+    app.server.add_url_rule("/_memory", view_func=memory_report)
+    app.server.add_url_rule(QUERY_API_PATH, view_func=energy_query)
+    app.server.add_url_rule(LOCATE_API_PATH, view_func=locate_point)
+    return app
+
+
+app = create_app()
+
+server = app.server
+
 if __name__ == '__main__':
     app.run_server(debug=DEBUG)
@@ -0,0 +1,102 @@
+/*
+ * Clientside versions of the hover-driven headers and small charts.
+ *
+ * The figures are built from the compact aggregate app.py ships once in the
+ * "clientside-aggregates" store and mirror what plotly.express produces for
+ * the server side callbacks of the same name.
+ */
+(function() {
+    function hoverYear(hoverData) {
+        return hoverData.points[0].x;
+    }
+
+    function baseLayout(store) {
+        return Object.assign({
+            template: store.template,
+            legend: {tracegroupgap: 0},
+            margin: {t: 60}
+        }, store.plot_colors);
+    }
+
+    function energyBar(store, values, maxY) {
+        var data = store.energy_types.map(function(energyType, i) {
+            return {
+                type: "bar",
+                name: energyType,
+                x: [energyType],
+                y: [values[i]],
+                marker: {color: store.colors[energyType]},
+                legendgroup: energyType,
+                offsetgroup: energyType,
+                alignmentgroup: "True",
+                orientation: "v",
+                showlegend: true,
+                textposition: "auto",
+                hovertemplate: "Energy type=%{x}<br>GWh=%{y}<extra></extra>"
+            };
+        });
+        var layout = baseLayout(store);
+        layout.barmode = "relative";
+        layout.legend.title = {text: "Energy type"};
+        layout.xaxis = {
+            title: {text: "Energy type"},
+            categoryorder: "total ascending",
+            categoryarray: store.energy_types
+        };
+        layout.yaxis = {title: {text: "GWh"}, range: [0, maxY]};
+        return {data: data, layout: layout};
+    }
+
+    function energyPie(store, values) {
+        var data = [{
+            type: "pie",
+            labels: store.energy_types,
+            values: values,
+            marker: {colors: store.energy_types.map(function(energyType) {
+                return store.colors[energyType];
+            })},
+            hole: 0.5,
+            name: "",
+            domain: {x: [0, 1], y: [0, 1]},
+            textposition: "inside",
+            textinfo: "percent+label",
+            hovertemplate: "Energy type=%{label}<br>GWh=%{value}<extra></extra>"
+        }];
+        var layout = baseLayout(store);
+        layout.showlegend = false;
+        return {data: data, layout: layout};
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        energy: {
+            consumptionHeader: function(hoverData) {
+                return "Energy consumption (" + hoverYear(hoverData) + ")";
+            },
+            percentageHeader: function(hoverData) {
+                return "Energy consumption (%) (" + hoverYear(hoverData) + ")";
+            },
+            ukCircleHeader: function(yearValue) {
+                return "Aggregate resource usage in the UK (" + yearValue + ")";
+            },
+            regionHeader: function(location) {
+                return location;
+            },
+            lauaBarHeader: function(location, yearValue) {
+                return "Energy consumption per local authority (" + yearValue + ")";
+            },
+            ukEnergyBar: function(hoverData, store) {
+                return energyBar(store, store.uk[hoverYear(hoverData)], store.uk_range_y[1]);
+            },
+            regionEnergyBar: function(location, hoverData, store) {
+                return energyBar(store, store.regions[location][hoverYear(hoverData)],
+                                 store.region_max[location]);
+            },
+            ukPercentCircle: function(hoverData, store) {
+                return energyPie(store, store.uk[hoverYear(hoverData)]);
+            },
+            regionPercentCircle: function(location, hoverData, store) {
+                return energyPie(store, store.regions[location][hoverYear(hoverData)]);
+            }
+        }
+    });
+})();
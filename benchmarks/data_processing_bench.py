@@ -0,0 +1,104 @@
+"""Times the data_processing and filter_tools functions on synthetic datasets
+at several multiples of the real dataset's size, recording peak memory
+
+    python -m benchmarks.data_processing_bench --output benchmarks/baselines/<commit>.json
+    python -m benchmarks.data_processing_bench --compare benchmarks/baselines/<commit>.json
+
+Results are written as JSON so runs on different commits can be diffed.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import pandas as pd
+
+import data_processing as dp
+import filter_tools
+from benchmarks.generate_dataset import generate_dataframe
+
+SCALES = [1, 10, 100]
+
+def cases(raw_df, dff):
+    """(name, callable) pairs, each run against the same inputs"""
+    year = int(dff["Year"].min())
+    location = dff["Name"].iloc[0]
+    return [
+        ("preprocess_dataframe", lambda: dp.preprocess_dataframe(raw_df)),
+        ("combine_regions", lambda: dp.combine_regions(
+            dff, ["East Midlands", "West Midlands"], "Midlands", "GWh")),
+        ("melt_dataframe", lambda: dp.melt_dataframe(dff)),
+        ("calculate_rate_of_change_df", lambda: dp.calculate_rate_of_change_df(location, dff)),
+        ("calculate_energy_proportion_df", lambda: dp.calculate_energy_proportion_df(year, dff)),
+        ("filter_energy_type", lambda: filter_tools.filter_energy_type(dff, "Coal")),
+    ]
+
+def measure(func, repeat):
+    """Best wall time of `repeat` runs and peak traced memory of one run"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(timings), "peak_bytes": peak}
+
+def run(scales, repeat):
+    results = {}
+    for scale in scales:
+        raw_df = generate_dataframe(scale=scale)
+        dff = dp.preprocess_dataframe(raw_df)
+        for name, func in cases(raw_df, dff):
+            result = measure(func, repeat)
+            result["input_rows"] = len(raw_df) if name == "preprocess_dataframe" else len(dff)
+            results.setdefault(name, {})[str(scale)] = result
+            print(f"{name:<32}{scale:>5}x{result['seconds'] * 1000:>12.2f} ms"
+                  f"{result['peak_bytes'] / 1e6:>12.1f} MB")
+    return results
+
+def compare(results, baseline):
+    print(f"\n{'function':<32}{'scale':>6}{'time':>10}{'memory':>10}  (current / baseline)")
+    for name, scales in results.items():
+        for scale, result in scales.items():
+            previous = baseline["results"].get(name, {}).get(scale)
+            if previous is None:
+                continue
+            print(f"{name:<32}{scale:>5}x{result['seconds'] / previous['seconds']:>10.2f}"
+                  f"{result['peak_bytes'] / max(previous['peak_bytes'], 1):>10.2f}")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    args = parser.parse_args()
+
+    results = run(args.scales, args.repeat)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as outjson:
+            json.dump(report, outjson, indent=2)
+    if args.compare:
+        with open(args.compare) as injson:
+            compare(results, json.load(injson))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Reports the serialized size of a choropleth figure per GeoJSON file, at
+full resolution and at every simplification level
+
+    python -m benchmarks.figure_payload
+"""
+import json
+import os
+
+import plotly.express as px
+
+import geometry
+
+FEATURE_ID_KEYS = {
+    "nuts_level_1": "nuts118nm",
+    "uk": "union",
+    "countries": "country",
+    "laua": "lau118cd",
+}
+
+def figure_bytes(geojson, featureidkey):
+    locations = [feature["properties"][featureidkey] for feature in geojson["features"]]
+    fig = px.choropleth_mapbox(
+        {"location": locations, "value": list(range(len(locations)))},
+        geojson=geojson,
+        locations="location",
+        color="value",
+        featureidkey=f"properties.{featureidkey}",
+    )
+    return len(fig.to_json())
+
+def main():
+    print(f"{'geojson':<14}{'level':<10}{'bytes':>12}{'ratio':>9}")
+    for name, featureidkey in FEATURE_ID_KEYS.items():
+        full_bytes = figure_bytes(geometry.load_geojson(name), featureidkey)
+        print(f"{name:<14}{'full':<10}{full_bytes:>12,}{1:>9.1f}")
+        for level, _, _ in geometry.ZOOM_LEVELS:
+            fpath = geometry.simplified_fpath(name, level)
+            if not os.path.exists(fpath):
+                continue
+            with open(fpath) as injson:
+                level_bytes = figure_bytes(json.load(injson), featureidkey)
+            print(f"{name:<14}{level:<10}{level_bytes:>12,}{full_bytes / level_bytes:>9.1f}")
+
+if __name__ == "__main__":
+    main()
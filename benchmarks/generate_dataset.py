@@ -0,0 +1,133 @@
+"""Generates synthetic subnational energy consumption CSVs in the schema of
+Subnational_total_final_energy_consumption_statistics.csv
+
+Local authority rows are followed by the uppercase row of the region they
+belong to, whose values are the sum of its local authorities, as in the
+published dataset.
+
+    python -m benchmarks.generate_dataset output.csv --scale 10
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+SUBSECTORS = {
+    "COAL": ["Coal_Industrial", "Coal_Commercial", "Coal_Domestic", "Coal_Rail",
+             "Coal_Public", "Coal_Agriculture"],
+    "MANUFACTURED": ["Manufactured_Industrial", "Manufactured_Domestic"],
+    "PETROLEUM": ["Petroleum_Industrial", "Petroleum_Road_transport", "Petroleum_Rail",
+                  "Petroleum_Domestic", "Petroleum_Public", "Petroleum_Agriculture"],
+    "GAS": ["Gas_Domestic", "Gas_Industrial"],
+    "ELECTRICITY": ["Electricity_Domestic", "Electricity_Industrial"],
+    "BIOENERGY": ["Bioenergy_Commercial", "Bioenergy_Domestic"],
+}
+TOTAL_COLUMNS = {
+    "COAL": "Total_COAL",
+    "MANUFACTURED": "Total_MANUFACTURED",
+    "PETROLEUM": "Total_PETROLEUM",
+    "GAS": "Gas_Total",
+    "ELECTRICITY": "Electricity_Total",
+    "BIOENERGY": "Bioenergy_All",
+}
+FUEL_COLUMNS = [col for fuel in SUBSECTORS for col in SUBSECTORS[fuel] + [TOTAL_COLUMNS[fuel]]]
+FUEL_COLUMNS.append("ALL_FUELS_TOTAL")
+
+# (code, name, country) of the NUTS level 1 regions, London split as published
+REGIONS = [
+    ("E12000001", "NORTH EAST", "E"),
+    ("E12000002", "NORTH WEST", "E"),
+    ("E12000003", "YORKSHIRE AND THE HUMBER", "E"),
+    ("E12000004", "EAST MIDLANDS", "E"),
+    ("E12000005", "WEST MIDLANDS", "E"),
+    ("E12000006", "EAST OF ENGLAND", "E"),
+    ("E13000001", "INNER LONDON", "E"),
+    ("E13000002", "OUTER LONDON", "E"),
+    ("E12000008", "SOUTH EAST", "E"),
+    ("E12000009", "SOUTH WEST", "E"),
+    ("W92000004", "WALES", "W"),
+    ("S92000003", "SCOTLAND", "S"),
+    ("N92000002", "NORTHERN IRELAND", "N"),
+]
+KTOE_PER_GWH = 0.0859845
+
+def local_authorities(laua_fpath="laua.geojson"):
+    """(code, name) of every local authority in the LAU boundary file"""
+    with open(laua_fpath) as injson:
+        geojson = json.load(injson)
+    return [(feature["properties"]["lau118cd"], feature["properties"]["lau118nm"])
+            for feature in geojson["features"]]
+
+def generate_dataframe(years=range(2005, 2019), scale=1, units=("GWh", "ktoe"),
+                       seed=0, laua_fpath="laua.geojson") -> "pandas.DataFrame":
+    """Builds the synthetic dataset. `scale` multiplies the number of local
+    authorities and of regions; regions beyond the real ones get synthetic
+    uppercase names."""
+    rng = np.random.default_rng(seed)
+    lauas = local_authorities(laua_fpath)
+
+    regions = []
+    for copy in range(scale):
+        suffix = "" if copy == 0 else f" {copy}"
+        regions.extend((code, name + suffix, country) for code, name, country in REGIONS)
+
+    # Spread the local authorities of each country over its regions
+    members = {region: [] for region in range(len(regions))}
+    for copy in range(scale):
+        suffix = "" if copy == 0 else f" {copy}"
+        for i, (code, name) in enumerate(lauas):
+            candidates = [r for r in range(copy * len(REGIONS), (copy + 1) * len(REGIONS))
+                          if regions[r][2] == code[0]]
+            members[candidates[i % len(candidates)]].append((code, name + suffix))
+
+    n_subsectors = sum(len(cols) for cols in SUBSECTORS.values())
+    frames = []
+    for year in years:
+        rows, names, codes = [], [], []
+        for region, (code, name, _) in enumerate(regions):
+            lau_values = rng.gamma(2.0, 150.0, size=(len(members[region]), n_subsectors))
+            rows.extend(lau_values)
+            rows.append(lau_values.sum(axis=0))
+            codes.extend(lau_code for lau_code, _ in members[region])
+            names.extend(lau_name for _, lau_name in members[region])
+            codes.append(code)
+            names.append(name)
+        subsector_values = np.array(rows)
+
+        values = {}
+        start = 0
+        for fuel, cols in SUBSECTORS.items():
+            block = subsector_values[:, start:start + len(cols)]
+            values.update(zip(cols, block.T))
+            values[TOTAL_COLUMNS[fuel]] = block.sum(axis=1)
+            start += len(cols)
+        values["ALL_FUELS_TOTAL"] = subsector_values.sum(axis=1)
+
+        for unit in units:
+            factor = 1 if unit == "GWh" else KTOE_PER_GWH
+            frame = pd.DataFrame({col: values[col] * factor for col in FUEL_COLUMNS})
+            frame.insert(0, "UNIT", unit)
+            frame.insert(0, "LAUA", codes)
+            frame.insert(0, "NAME", names)
+            frame.insert(0, "YEAR", year)
+            frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--first-year", type=int, default=2005)
+    parser.add_argument("--last-year", type=int, default=2018)
+    parser.add_argument("--units", nargs="+", default=["GWh", "ktoe"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = generate_dataframe(range(args.first_year, args.last_year + 1), args.scale,
+                            args.units, args.seed)
+    df.to_csv(args.output, index=False)
+    print(f"Wrote {len(df):,} rows to {args.output}")
+
+if __name__ == "__main__":
+    main()
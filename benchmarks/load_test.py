@@ -0,0 +1,401 @@
+"""Replays dashboard interaction traces against a running app with concurrent
+virtual users, reporting throughput, latency percentiles per callback
+output and error rate
+
+    python app.py &
+    python -m benchmarks.load_test --users 20 --duration 60
+    python -m benchmarks.load_test --trace sweeps.jsonl --users 50 --output load.json
+    python -m benchmarks.load_test --api --users 8 --duration 30
+
+A trace is a JSON lines file of interaction events, t being seconds since
+the start of the trace
+
+    {"t": 0.04, "id": "all-regions-line-plot", "property": "hoverData", "value": {"points": [{"x": 2012}]}}
+
+Without --trace every user replays its own synthetic trace of fast hover
+sweeps over the line plots and region dropdown changes; --write-trace saves
+one for editing and replaying.
+
+Requests are built the way the Dash renderer builds them from
+/_dash-dependencies: an event fires every server side callback with the
+changed property as an input, sent with the user's current values of the
+other inputs and state, and outputs that are inputs of further callbacks
+fire those in turn. Clientside callbacks run in the browser and are not
+replayed. Each user sends its requests one at a time over a keep-alive
+connection and follows the trace's timing unless it falls behind.
+
+With --api the users instead send GET /api/energy queries back to back,
+drawn from a pool of --api-queries random queries over every level,
+region, fuel and year range, so repeats are answered from the response
+cache. --api-queries 0 makes every query unique, measuring uncached
+throughput. Responses are not decoded, keeping the client's share of the
+time small.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+
+PERCENTILES = [50, 95, 99]
+HOVER_SWEEP_IDS = ["all-regions-line-plot", "region-time-series-scatter"]
+REGION_DROPDOWN_ID = "region-dropdown"
+YEAR_SLIDER_ID = "region-choropleth-year-slider"
+HOVER_INTERVAL = 0.03
+API_PATH = "/api/energy"
+API_LEVELS = ["uk", "region", "laua"]
+API_FUELS = ["Coal", "Manufactured", "Petroleum", "Gas", "Electricity", "Bioenergy"]
+
+class Connection:
+    def __init__(self, base_url: str, timeout: float = 30):
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, body=None, decode=True):
+        """(status, decoded JSON or None) of one request"""
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {"Accept-Encoding": "gzip"}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        try:
+            self._conn.request(method, self.prefix + path, body, headers)
+            response = self._conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if not decode:
+            return response.status, None
+        if response.getheader("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        if response.status != 200 or not data:
+            return response.status, None
+        return response.status, json.loads(data)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class Dashboard:
+    """The server side callbacks of a running app and its initial state"""
+
+    def __init__(self, base_url: str):
+        conn = Connection(base_url)
+        _, dependencies = conn.request("GET", "/_dash-dependencies")
+        _, layout = conn.request("GET", "/_dash-layout")
+        conn.close()
+        self.props = {}
+        self._collect_props(layout)
+        # The renderer never fires callbacks whose outputs are not in the layout
+        self.callbacks = [
+            dep for dep in dependencies if not dep.get("clientside_function")
+            and any(output["id"] in self.props for output in output_list(dep))
+        ]
+        self.triggers = defaultdict(list)
+        for dep in self.callbacks:
+            for item in dep["inputs"]:
+                self.triggers[prop_id(item)].append(dep)
+
+    def _collect_props(self, node):
+        if isinstance(node, list):
+            for child in node:
+                self._collect_props(child)
+        elif isinstance(node, dict) and "props" in node:
+            props = node["props"]
+            if "id" in props:
+                self.props[props["id"]] = props
+            self._collect_props(props.get("children"))
+
+    def initial_state(self) -> dict:
+        """Value of every property a server side callback reads"""
+        state = {}
+        for dep in self.callbacks:
+            for item in dep["inputs"] + dep.get("state", []):
+                state[prop_id(item)] = self.props.get(item["id"], {}).get(item["property"])
+        return state
+
+    def synthetic_trace(self, duration: float, rng: random.Random) -> list:
+        """Fast hover sweeps across the years of the line plots, each
+        followed by a pause, with a region change now and then"""
+        slider = self.props[YEAR_SLIDER_ID]
+        years = list(range(slider["min"], slider["max"] + 1))
+        regions = [option["value"] if isinstance(option, dict) else option
+                   for option in self.props[REGION_DROPDOWN_ID]["options"]]
+        events, t = [], 0.0
+        while t < duration:
+            if rng.random() < 0.2:
+                events.append(event(t, REGION_DROPDOWN_ID, "value", rng.choice(regions)))
+            else:
+                graph_id = rng.choice(HOVER_SWEEP_IDS)
+                sweep = years[rng.randrange(len(years)):] if rng.random() < 0.5 else years
+                if rng.random() < 0.5:
+                    sweep = sweep[::-1]
+                for year in sweep:
+                    events.append(event(t, graph_id, "hoverData", {"points": [{"x": year}]}))
+                    t += HOVER_INTERVAL
+            t += rng.uniform(0.2, 1.5)
+        return events
+
+class VirtualUser(threading.Thread):
+    def __init__(self, dashboard, base_url, trace, duration, results, speed=1.0):
+        super().__init__(daemon=True)
+        self.dashboard = dashboard
+        self.conn = Connection(base_url)
+        self.trace = trace
+        self.duration = duration
+        self.results = results
+        self.speed = speed
+        self.state = dashboard.initial_state()
+
+    def run(self):
+        start = time.perf_counter()
+        end = start + self.duration
+        trace_length = self.trace[-1]["t"] + HOVER_INTERVAL
+        loop = 0
+        while True:
+            for item in self.trace:
+                due = start + (loop * trace_length + item["t"]) / self.speed
+                now = time.perf_counter()
+                if due >= end or now >= end:
+                    self.conn.close()
+                    return
+                if due > now:
+                    time.sleep(due - now)
+                self.interact(prop_id(item), item["value"])
+            loop += 1
+
+    def interact(self, changed: str, value):
+        """Sets a property and fires the callbacks it triggers, then those
+        triggered by their outputs"""
+        self.state[changed] = value
+        queue = [changed]
+        while queue:
+            changed = queue.pop(0)
+            for dep in self.dashboard.triggers.get(changed, []):
+                queue.extend(self.fire(dep, changed))
+
+    def fire(self, dep, changed) -> list:
+        """Posts one callback, returning the properties it changed"""
+        body = {
+            "output": dep["output"],
+            "outputs": outputs(dep),
+            "inputs": [dict(item, value=self.state.get(prop_id(item))) for item in dep["inputs"]],
+            "state": [dict(item, value=self.state.get(prop_id(item))) for item in dep.get("state", [])],
+            "changedPropIds": [changed],
+        }
+        start = time.perf_counter()
+        try:
+            status, response = self.conn.request("POST", "/_dash-update-component", body)
+        except (OSError, http.client.HTTPException):
+            status, response = None, None
+        elapsed = time.perf_counter() - start
+        self.results.append((dep["output"], elapsed, status in (200, 204)))
+
+        changed_props = []
+        for component_id, props in ((response or {}).get("response") or {}).items():
+            for prop, value in props.items():
+                self.state[f"{component_id}.{prop}"] = value
+                changed_props.append(f"{component_id}.{prop}")
+        return changed_props
+
+class EnergyApi:
+    """Random /api/energy queries over the years and regions a running app
+    serves"""
+
+    def __init__(self, base_url: str):
+        conn = Connection(base_url)
+        self.years = sorted({row[0] for row in self._rows(conn, "level=uk")})
+        # Not every region has local authorities
+        self.regions = {
+            level: sorted({row[0] for row in self._rows(
+                conn, f"level={level}&year_from={self.years[-1]}&year_to={self.years[-1]}")})
+            for level in API_LEVELS if level != "uk"
+        }
+        conn.close()
+
+    @staticmethod
+    def _rows(conn, query: str) -> list:
+        """Rows of every page of a query"""
+        rows, offset = [], 0
+        while offset is not None:
+            _, page = conn.request("GET", f"{API_PATH}?{query}&offset={offset}")
+            rows += page["rows"]
+            offset = page["next_offset"]
+        return rows
+
+    def query(self, rng: random.Random) -> list:
+        """(name, value) parameters of one query"""
+        level = rng.choice(API_LEVELS)
+        params = [("level", level)]
+        if level != "uk" and rng.random() < 0.7:
+            params.append(("region", rng.choice(self.regions[level])))
+        if rng.random() < 0.5:
+            params.append(("fuel", rng.choice(API_FUELS)))
+        if rng.random() < 0.5:
+            first = rng.randrange(len(self.years))
+            params += [("year_from", self.years[first]),
+                       ("year_to", rng.choice(self.years[first:]))]
+        return params
+
+class ApiUser(threading.Thread):
+    """Sends /api/energy queries back to back, from `pool` or, without
+    one, a new unique query every time"""
+
+    def __init__(self, api, base_url, pool, duration, results, seed):
+        super().__init__(daemon=True)
+        self.api = api
+        self.conn = Connection(base_url)
+        self.pool = pool
+        self.duration = duration
+        self.results = results
+        self.rng = random.Random(seed)
+
+    def run(self):
+        end = time.perf_counter() + self.duration
+        sent = 0
+        while time.perf_counter() < end:
+            if self.pool:
+                params = self.rng.choice(self.pool)
+            else:
+                # Parameters the API does not know still change the ETag
+                params = self.api.query(self.rng) + [("nonce", f"{self.ident}-{sent}")]
+            path = f"{API_PATH}?{urllib.parse.urlencode(params)}"
+            start = time.perf_counter()
+            try:
+                status, _ = self.conn.request("GET", path, decode=False)
+            except (OSError, http.client.HTTPException):
+                status = None
+            elapsed = time.perf_counter() - start
+            self.results.append((f"GET {API_PATH} level={params[0][1]}", elapsed, status == 200))
+            sent += 1
+        self.conn.close()
+
+def prop_id(item) -> str:
+    return f"{item['id']}.{item['property']}"
+
+def event(t, component_id, prop, value) -> dict:
+    return {"t": round(t, 3), "id": component_id, "property": prop, "value": value}
+
+def output_list(dep) -> list:
+    """{"id", "property"} of every output of a callback"""
+    outputs = dep["output"][2:-2].split("...") if dep["output"].startswith("..") else [dep["output"]]
+    return [dict(zip(("id", "property"), output.rsplit(".", 1))) for output in outputs]
+
+def outputs(dep):
+    """The outputs field of a callback request, a list for multi output
+    callbacks"""
+    if dep["output"].startswith(".."):
+        return output_list(dep)
+    return output_list(dep)[0]
+
+def read_trace(fpath: str) -> list:
+    with open(fpath) as infile:
+        return [json.loads(line) for line in infile if line.strip()]
+
+def write_trace(trace, fpath: str):
+    with open(fpath, "w") as outfile:
+        for item in trace:
+            outfile.write(json.dumps(item) + "\n")
+
+def summarize(results, wall_seconds) -> dict:
+    by_output = defaultdict(list)
+    for output, elapsed, ok in results:
+        by_output[output].append((elapsed, ok))
+    errors = sum(not ok for _, _, ok in results)
+    report = {
+        "requests": len(results),
+        "seconds": wall_seconds,
+        "requests_per_second": len(results) / wall_seconds,
+        "error_rate": errors / len(results) if results else 0.0,
+        "outputs": {},
+    }
+    for output, samples in sorted(by_output.items()):
+        latencies = sorted(elapsed for elapsed, _ in samples)
+        summary = {
+            "requests": len(samples),
+            "requests_per_second": len(samples) / wall_seconds,
+            "error_rate": sum(not ok for _, ok in samples) / len(samples),
+            "max_ms": 1000 * latencies[-1],
+        }
+        for percentile in PERCENTILES:
+            index = min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))
+            summary[f"p{percentile}_ms"] = 1000 * latencies[index]
+        report["outputs"][output] = summary
+    return report
+
+def format_report(report, label="callback output") -> str:
+    lines = [f"{report['requests']} requests in {report['seconds']:.1f} s, "
+             f"{report['requests_per_second']:.1f} req/s, "
+             f"{100 * report['error_rate']:.2f}% errors",
+             f"{label:<60}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+             f"{'p99 ms':>9}{'max ms':>9}{'errors':>8}"]
+    for output, summary in report["outputs"].items():
+        lines.append(
+            f"{output[:59]:<60}{summary['requests_per_second']:>8.1f}{summary['p50_ms']:>9.1f}"
+            f"{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}{summary['max_ms']:>9.1f}"
+            f"{100 * summary['error_rate']:>7.1f}%"
+        )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8050")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--ramp-up", type=float, default=0,
+                        help="seconds over which the users start")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="multiplies the pace of the trace")
+    parser.add_argument("--trace", help="JSON lines trace replayed by every user")
+    parser.add_argument("--write-trace", help="write a synthetic trace and exit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--api", action="store_true",
+                        help=f"send back to back {API_PATH} queries instead of traces")
+    parser.add_argument("--api-queries", type=int, default=500,
+                        help="distinct queries the --api users draw from, 0 for all unique")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    users = []
+    if args.api:
+        api = EnergyApi(args.url)
+        pool = [api.query(rng) for _ in range(args.api_queries)]
+        for i in range(args.users):
+            users.append(ApiUser(api, args.url, pool, args.duration, results, args.seed + i))
+    else:
+        dashboard = Dashboard(args.url)
+        if args.write_trace:
+            write_trace(dashboard.synthetic_trace(args.duration, rng), args.write_trace)
+            return
+        recorded = read_trace(args.trace) if args.trace else None
+        for _ in range(args.users):
+            trace = recorded or dashboard.synthetic_trace(args.duration, rng)
+            users.append(VirtualUser(dashboard, args.url, trace, args.duration, results, args.speed))
+    start = time.perf_counter()
+    for i, user in enumerate(users):
+        user.start()
+        if args.ramp_up and i < len(users) - 1:
+            time.sleep(args.ramp_up / len(users))
+    for user in users:
+        user.join()
+    report = summarize(results, time.perf_counter() - start)
+
+    print(format_report(report, "request" if args.api else "callback output"))
+    if args.output:
+        with open(args.output, "w") as outjson:
+            json.dump(report, outjson, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Measures how long a fresh process takes to import app.py and to serve
+its first layout and callback, each in its own interpreter
+
+    python -m benchmarks.startup [--repeat N]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, time, warnings
+warnings.simplefilter("ignore")
+timings = {}
+start = time.perf_counter()
+import app
+timings["import app"] = time.perf_counter() - start
+client = app.app.server.test_client()
+start = time.perf_counter()
+client.get("/_dash-layout")
+timings["first layout"] = time.perf_counter() - start
+start = time.perf_counter()
+client.post("/_dash-update-component", json={
+    "output": "..total-energy-consumption-percent.figure...total-energy-consumption-bar.figure..",
+    "outputs": [{"id": "total-energy-consumption-percent", "property": "figure"},
+                {"id": "total-energy-consumption-bar", "property": "figure"}],
+    "inputs": [{"id": "all-regions-line-plot", "property": "hoverData",
+                "value": {"points": [{"x": 2010}]}}],
+    "changedPropIds": ["all-regions-line-plot.hoverData"],
+})
+timings["first callback"] = time.perf_counter() - start
+start = time.perf_counter()
+client.get("/_dash-layout")
+timings["second layout"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.repeat):
+        output = subprocess.run([sys.executable, "-c", PROBE], check=True,
+                                capture_output=True, text=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    for stage in runs[0]:
+        median = statistics.median(run[stage] for run in runs)
+        print(f"{stage:<16}{median * 1000:>10.1f} ms")
+
+if __name__ == "__main__":
+    main()
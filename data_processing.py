@@ -1,21 +1,86 @@
-import datetime
+import hashlib
+import os
 
+import numpy as np
 import pandas as pd
 
 from regional_information import regional_information
 
+ENERGY_TYPES = ["Coal", "Manufactured", "Petroleum", "Gas", "Electricity", "Bioenergy"]
+FUEL_TOTAL_COLUMNS = [f"{energy_type}_Total" for energy_type in ENERGY_TYPES]
+
+# LAUA code prefixes of local authority rows, as opposed to regions,
+# countries and the unallocated/DUKES reconciliation rows
+LAUA_CODE_PREFIXES = ["E06", "E07", "E08", "E09", "W06", "S12", "N09"]
+
+# Regions published as several subregions, summed into one
+COMBINED_REGIONS = {"London": ["Inner London", "Outer London", "Greater London"]}
+
+CSV_CHUNK_ROWS = 100_000
+
+# dtype of the fuel columns, float32 halves their footprint
+FUEL_DTYPE = os.environ.get("FUEL_DTYPE", "float32")
+# Largest relative error narrowing to FUEL_DTYPE may cause in a plotted total
+FUEL_DTYPE_RTOL = 1e-5
+
 def preprocess_dataframe(df: "pandas.DataFrame") -> "pandas.DataFrame":
     dff = df[df["UNIT"] == "GWh"]
     dff = dff[dff["NAME"].str.isupper()]
     dff = dff.drop(columns=["LAUA"])
 
+    dff = tidy_columns(dff, ["YEAR", "NAME", "UNIT"])
+    dff["Name"] = dff["Name"].str.title()
+
+    for region_name, subregions in COMBINED_REGIONS.items():
+        dff = combine_regions(dff, subregions, region_name, "GWh")
+    dff = compact_dtypes(dff, ["Name", "Unit"])
+
+    # Reset the index
+    dff = dff.reset_index(drop=True)
+
+    # Sort by year then name
+    dff = dff.sort_values(["Year", "Name"])
+    return dff
+
+def preprocess_csv_chunks(csv_fpath: str, preprocess=preprocess_dataframe,
+                          chunksize: int = CSV_CHUNK_ROWS):
+    """Yields `preprocess` applied to the CSV `chunksize` rows at a time, so
+    only one chunk of the raw file is in memory at once
+
+    The subregions of a combined region can fall in different chunks. Each
+    chunk's partial sums of those regions are held back and added up into
+    the last chunk yielded.
+    """
+    partials = []
+    for chunk in pd.read_csv(csv_fpath, chunksize=chunksize):
+        dff = preprocess(chunk)
+        combined = dff["Name"].isin(COMBINED_REGIONS)
+        partials.append(dff[combined])
+        yield dff[~combined]
+
+    dff = pd.concat(partials)
+    for region_name in COMBINED_REGIONS:
+        dff = combine_regions(dff, [region_name], region_name, "GWh")
+    yield dff.reset_index(drop=True)
+
+def preprocess_laua_dataframe(df: "pandas.DataFrame") -> "pandas.DataFrame":
+    """Local authority rows in GWh, keeping their LAUA code in a Code column"""
+    dff = df[df["UNIT"] == "GWh"]
+    dff = dff[dff["LAUA"].str[:3].isin(LAUA_CODE_PREFIXES)]
+    dff = dff.rename(columns={"LAUA": "CODE"})
+
+    dff = tidy_columns(dff, ["YEAR", "CODE", "NAME", "UNIT"])
+    dff = compact_dtypes(dff, ["Code", "Name", "Unit"])
+    dff = dff.sort_values(["Year", "Code"])
+    return dff.reset_index(drop=True)
+
+def tidy_columns(dff, descriptive_columns):
     # Reorder the columns
-    descriptive_columns = ["YEAR", "NAME", "UNIT"]
     other_columns = [col for col in dff.columns if col not in descriptive_columns]
     all_columns = descriptive_columns + other_columns
     dff = dff[all_columns]
 
-    # Title the columns and region names
+    # Title the columns
     dff = dff.rename(columns={col: col.title() for col in all_columns})
     dff = dff.rename(columns={
         "Bioenergy_All": "Bioenergy_Total",
@@ -23,26 +88,42 @@ def preprocess_dataframe(df: "pandas.DataFrame") -> "pandas.DataFrame":
         "Total_Manufactured": "Manufactured_Total",
         "Total_Petroleum": "Petroleum_Total"
     })
-    dff["Name"] = dff["Name"].str.title()
-
-    dff = combine_regions(
-        dff,
-        ["Inner London", "Outer London", "Greater London"],
-        "London",
-        "GWh"
-    )
-
-    # Reset the index
-    dff = dff.reset_index(drop=True)
+    return dff
 
-    # Sort by year then name
-    dff = dff.sort_values(["Year", "Name"])
+def compact_dtypes(dff, categorical_columns, fuel_dtype=FUEL_DTYPE):
+    """Categorical labels, the smallest integer type for Year and
+    `fuel_dtype` fuel columns"""
+    dff = dff.astype({col: "category" for col in categorical_columns})
+    dff["Year"] = pd.to_numeric(dff["Year"], downcast="integer")
+    fuel_columns = [col for col in dff.columns if dff[col].dtype.kind == "f"]
+    narrowed = dff[fuel_columns].astype(fuel_dtype)
+    check_totals(dff, narrowed)
+    dff[fuel_columns] = narrowed
     return dff
 
+def check_totals(dff, narrowed, rtol=FUEL_DTYPE_RTOL):
+    """Raises ValueError if the narrowed fuel columns move any total the
+    dashboard plots, per row or summed per year, by more than `rtol`"""
+    totals_columns = [col for col in FUEL_TOTAL_COLUMNS + ["All_Fuels_Total"] if col in dff]
+    expected = dff[totals_columns].astype(float)
+    actual = narrowed[totals_columns]
+    checks = [
+        (expected, actual),
+        (expected.groupby(dff["Year"]).sum(), actual.groupby(dff["Year"]).sum()),
+    ]
+    for expected_totals, actual_totals in checks:
+        expected_values = expected_totals.to_numpy()
+        actual_values = actual_totals.to_numpy(dtype=float)
+        if not np.allclose(actual_values, expected_values, rtol=rtol, atol=0, equal_nan=True):
+            error = np.nanmax(np.abs(actual_values - expected_values) / np.abs(expected_values))
+            raise ValueError(f"{narrowed.dtypes.iloc[0]} fuel columns are off by up to "
+                             f"{error:.2g} relative, over the {rtol:g} tolerance; "
+                             "set FUEL_DTYPE=float64")
+
 def combine_regions(df, subregions, region_name, unit):
     subregion_df = df[df["Name"].isin(subregions)]
     full_df = df[~df["Name"].isin(subregions)]
-    region_df = subregion_df.groupby(["Year"], as_index=False).sum()
+    region_df = subregion_df.groupby(["Year"], as_index=False).sum(numeric_only=True)
     region_df["Name"] = region_name
     region_df["Unit"] = unit
     return pd.concat([full_df, region_df])
@@ -57,8 +138,7 @@ def melt_dataframe(df: "pandas.DataFrame") -> "pandas.DataFrame":
     totals_df = totals_df.rename(columns={col: col.replace("_Total", "") for col in totals_df.columns})
 
     id_vars = [col for col in descriptive_columns if col in df.columns]
-    long_df = pd.melt(totals_df, id_vars=id_vars, value_vars=[
-                    "Coal", "Manufactured", "Petroleum", "Gas", "Electricity", "Bioenergy"])
+    long_df = pd.melt(totals_df, id_vars=id_vars, value_vars=ENERGY_TYPES)
     long_df = long_df.rename(columns={"variable": "Energy type", "value": "GWh"})
     return long_df
 
@@ -71,9 +151,27 @@ def construct_regional_geojson(location, geojson):
                       'features': region_geojson}
     return region_geojson
 
+def file_hash(fpath):
+    sha = hashlib.sha256()
+    with open(fpath, "rb") as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
 def click_location(clickData):
     return clickData['points'][0]['x']
 
+def map_click_location(clickData, index):
+    """Key of the feature clicked on a map: the clicked location when
+    `index` has it, otherwise the feature of `index` containing the clicked
+    coordinates"""
+    point = clickData['points'][0]
+    if point.get('location') in index:
+        return point['location']
+    if 'lon' in point and 'lat' in point:
+        return index.locate(point['lon'], point['lat'])
+    return None
+
 def construct_regional_markdown(location):
     region = regional_information[location]
     msg = f"""
@@ -83,32 +181,54 @@ def construct_regional_markdown(location):
 """
     return msg
 
-def calculate_rate_of_change_df(location, df):
-    region_df = df[df["Name"] == location]
-    region_df = region_df.drop(
-        columns=["Name", "Unit"])
-    region_df = region_df.set_index("Year")
-
-    year_change_df = region_df.pct_change().cumsum()
-    year_change_df *= 100
-
-    year_change_df = melt_dataframe(
-        year_change_df.reset_index())
-
-    year_change_df["Year"] = year_change_df["Year"].apply(
-        lambda x: datetime.datetime.strptime(str(x), "%Y"))
-    return year_change_df
+def calculate_rate_of_change_df(location, df, compounded=False):
+    return rate_of_change(df[df["Name"] == location], compounded)
+
+def rate_of_change(df: "pandas.DataFrame", compounded: bool = False) -> "pandas.DataFrame":
+    """Long dataframe of the % change of every region's consumption per
+    energy type since its first year
+
+    By default the yearly rates are summed; `compounded` gives the true
+    growth relative to the first year instead.
+    """
+    df = df.sort_values(["Name", "Year"])
+    totals = df[FUEL_TOTAL_COLUMNS]
+    if compounded:
+        change = totals / totals.groupby(df["Name"], observed=True).transform("first") - 1
+        # Match the cumulative sum, which is undefined in the first year
+        change = change.mask(df["Year"] == df.groupby("Name", observed=True)["Year"].transform("first"))
+    else:
+        change = totals.groupby(df["Name"], observed=True).pct_change().groupby(df["Name"], observed=True).cumsum()
+    change *= 100
+
+    change["Name"] = df["Name"]
+    change["Year"] = pd.to_datetime(df["Year"].astype(str), format="%Y")
+    return melt_dataframe(change)
 
 def calculate_energy_proportion_df(year, df):
-    year_df = df[df["Year"] == year]
-    total_consumption_df = year_df.groupby("Name").sum()
-    highest_region = total_consumption_df[total_consumption_df["All_Fuels_Total"] == total_consumption_df["All_Fuels_Total"].max()].index
-    highest_region_df = year_df[year_df["Name"] == highest_region[0]]
-    adjusted_df = year_df.copy()
-    adjusted_df.iloc[:, 3:-4] = adjusted_df.iloc[:, 3:-4].div(adjusted_df["All_Fuels_Total"], axis=0)
-    long_adjusted_sum_df = pd.melt(adjusted_df, id_vars=["Year", "Name"], value_vars=[col for col in highest_region_df.columns if "Total" in col])
-    long_adjusted_sum_df = long_adjusted_sum_df.rename(columns={"variable": "Energy type", "value": "%"})
-    long_adjusted_sum_df["Energy type"] = long_adjusted_sum_df["Energy type"].str.replace(
-        "_Total", "")
-    long_adjusted_sum_df["%"] = long_adjusted_sum_df["%"] * 100
-    return long_adjusted_sum_df
+    return energy_proportions(df[df["Year"] == year])
+
+def energy_proportions(df: "pandas.DataFrame") -> "pandas.DataFrame":
+    """Long dataframe of each fuel's share (%) of every region's total
+    consumption, for every year in `df`
+
+    Computed in one pass over a (year, region, fuel) array, rows ordered by
+    year, then energy type, then region like `melt_dataframe`.
+    """
+    years = np.sort(df["Year"].unique())
+    names = np.sort(np.asarray(df["Name"].unique()))
+    index = pd.MultiIndex.from_product([years, names], names=["Year", "Name"])
+    values = df.set_index(["Year", "Name"]).reindex(index)[FUEL_TOTAL_COLUMNS + ["All_Fuels_Total"]]
+    values = values.to_numpy(dtype=float).reshape(len(years), len(names), len(ENERGY_TYPES) + 1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = values[:, :, :-1] / values[:, :, -1:] * 100
+    shares = shares.transpose(0, 2, 1)
+
+    long_df = pd.DataFrame({
+        "Year": np.repeat(years, len(ENERGY_TYPES) * len(names)),
+        "Name": np.tile(names, len(years) * len(ENERGY_TYPES)),
+        "Energy type": np.tile(np.repeat(ENERGY_TYPES, len(names)), len(years)),
+        "%": shares.ravel(),
+    })
+    return long_df.dropna(subset=["%"]).reset_index(drop=True)
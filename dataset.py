@@ -0,0 +1,135 @@
+"""Process-wide, lazily loaded data shared by the app's layout and callbacks
+
+Nothing is read until first use, so importing app.py stays cheap. Every
+accessor computes its value once per process.
+"""
+import functools
+import os
+
+import pandas as pd
+
+import data_processing as dp
+import plotting
+from aggregates import EnergyAggregates, LocalAuthorityAggregates, YearPrefixSums
+from dataset_cache import load_dataset
+from geometry import GeometryIndex, load_geojson, zoom_level
+from query_api import QueryIndex
+
+DATASET_FPATH = "Subnational_total_final_energy_consumption_statistics.csv"
+
+@functools.lru_cache(maxsize=None)
+def energy_dataframe() -> "pandas.DataFrame":
+    return load_dataset(DATASET_FPATH)
+
+@functools.lru_cache(maxsize=None)
+def laua_dataframe() -> "pandas.DataFrame":
+    return load_dataset(DATASET_FPATH, preprocess=dp.preprocess_laua_dataframe)
+
+@functools.lru_cache(maxsize=None)
+def version() -> str:
+    """Hash identifying the dataset release"""
+    return dp.file_hash(DATASET_FPATH)
+
+@functools.lru_cache(maxsize=None)
+def aggregates() -> EnergyAggregates:
+    return EnergyAggregates(energy_dataframe())
+
+@functools.lru_cache(maxsize=None)
+def prefix_sums() -> YearPrefixSums:
+    return YearPrefixSums(energy_dataframe())
+
+@functools.lru_cache(maxsize=None)
+def laua_regions() -> dict:
+    """Region containing each local authority, found from the label point
+    the boundary file gives every LAUA"""
+    regions = {}
+    for feature in load_geojson("laua")["features"]:
+        lon, lat = feature["properties"]["long"], feature["properties"]["lat"]
+        region = region_index().locate(lon, lat) or region_index().nearest(lon, lat)
+        regions[feature["properties"]["lau118cd"]] = region
+    return regions
+
+@functools.lru_cache(maxsize=None)
+def laua_aggregates() -> LocalAuthorityAggregates:
+    return LocalAuthorityAggregates(laua_dataframe(), laua_regions())
+
+@functools.lru_cache(maxsize=None)
+def year_marks() -> dict:
+    return {str(year): str(year) for year in aggregates().years}
+
+@functools.lru_cache(maxsize=None)
+def nuts_geojson() -> dict:
+    return load_geojson("nuts_level_1", zoom=plotting.UK_MAPBOX_ZOOM)
+
+@functools.lru_cache(maxsize=None)
+def uk_geojson() -> dict:
+    return load_geojson("uk", zoom=plotting.UK_MAPBOX_ZOOM)
+
+@functools.lru_cache(maxsize=None)
+def laua_level_geojson(level: str) -> dict:
+    return load_geojson("laua", level=level)
+
+@functools.lru_cache(maxsize=None)
+def laua_geojson(location: str) -> dict:
+    """The local authorities of a region, simplified for the zoom the
+    region is drawn at"""
+    geojson = laua_level_geojson(zoom_level(region_index().zoom(location)))
+    codes = set(laua_aggregates().codes(location))
+    region_geojson = {key: val for key, val in geojson.items() if key != "features"}
+    region_geojson["features"] = [
+        feature for feature in geojson["features"]
+        if feature["properties"]["lau118cd"] in codes
+    ]
+    return region_geojson
+
+@functools.lru_cache(maxsize=None)
+def region_index() -> GeometryIndex:
+    return GeometryIndex("nuts_level_1", ["nuts118nm"])
+
+@functools.lru_cache(maxsize=None)
+def laua_index() -> GeometryIndex:
+    return GeometryIndex("laua", ["lau118cd", "lau118nm"])
+
+@functools.lru_cache(maxsize=None)
+def query_index() -> QueryIndex:
+    return QueryIndex(energy_dataframe(), laua_dataframe(), laua_regions())
+
+def warm():
+    """Loads everything the callbacks read. A preloading server calls this
+    in its parent process so forked workers share the result instead of
+    each loading their own, see gunicorn.conf.py"""
+    for accessor in [energy_dataframe, laua_dataframe, version, aggregates, prefix_sums, laua_aggregates,
+                     year_marks, nuts_geojson, uk_geojson, region_index, laua_index,
+                     query_index]:
+        accessor()
+    for location in aggregates().regions:
+        if location in region_index():
+            laua_geojson(location)
+
+def memory_report() -> dict:
+    """Bytes held by the data this process has loaded so far, and its RSS"""
+    report = {"pid": os.getpid(), "rss_bytes": _rss_bytes(), "fuel_dtype": dp.FUEL_DTYPE}
+    for accessor in [energy_dataframe, laua_dataframe, aggregates, laua_aggregates]:
+        if accessor.cache_info().currsize:
+            report[f"{accessor.__name__}_bytes"] = _frame_bytes(accessor())
+    return report
+
+def _frame_bytes(obj) -> int:
+    """Deep memory usage of the dataframes in `obj`, its dicts and attributes"""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True, index=True).sum())
+    if isinstance(obj, dict):
+        return sum(_frame_bytes(value) for value in obj.values())
+    if hasattr(obj, "__dict__"):
+        return _frame_bytes(vars(obj))
+    return 0
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # Peak rather than current RSS where /proc is unavailable
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
@@ -0,0 +1,247 @@
+"""Memory-mapped columnar cache of the preprocessed dataset
+
+The first load streams the CSV through a preprocessing function
+(`preprocess_dataframe` by default) and writes every column as a .npy
+file. Later loads memory map those files instead. The cache is keyed by
+a hash of the CSV and of the preprocessing code, so it is rebuilt
+whenever either changes.
+
+Streamed chunks arrive in file order, so the rows are put back in the
+order `preprocess` returns them when the cache is written (see ROW_ORDER).
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+
+CACHE_DIR = ".dataset_cache"
+FORMAT_VERSION = 3
+
+# Columns the output of each preprocessing function is sorted by
+ROW_ORDER = {
+    dp.preprocess_dataframe: ["Year", "Name"],
+    dp.preprocess_laua_dataframe: ["Year", "Code"],
+}
+
+def preprocessing_version(preprocess=dp.preprocess_dataframe) -> str:
+    """Hash of the source of the functions that shape the cached frame and
+    of the settings they read"""
+    sha = hashlib.sha256(f"{FORMAT_VERSION}:{dp.FUEL_DTYPE}".encode())
+    for func in [preprocess, dp.preprocess_csv_chunks, dp.tidy_columns, dp.combine_regions,
+                 dp.compact_dtypes, dp.check_totals]:
+        sha.update(inspect.getsource(func).encode())
+    for setting in [dp.LAUA_CODE_PREFIXES, dp.COMBINED_REGIONS, dp.FUEL_DTYPE_RTOL,
+                    ROW_ORDER.get(preprocess)]:
+        sha.update(repr(setting).encode())
+    return sha.hexdigest()
+
+def cache_key(csv_fpath: str, preprocess=dp.preprocess_dataframe) -> str:
+    return hashlib.sha256(
+        (dp.file_hash(csv_fpath) + preprocessing_version(preprocess)).encode()
+    ).hexdigest()[:32]
+
+def load_dataset(csv_fpath: str, cache_dir: str = CACHE_DIR,
+                 preprocess=dp.preprocess_dataframe,
+                 chunksize: int = dp.CSV_CHUNK_ROWS) -> "pandas.DataFrame":
+    """Returns the dataframe `preprocess` makes of `csv_fpath`, building the
+    cache if it is missing or stale
+
+    The cache is built by streaming the CSV `chunksize` rows at a time, so
+    peak memory is bounded by the chunk size rather than the file size.
+    """
+    fpath = os.path.join(cache_dir, cache_key(csv_fpath, preprocess))
+    if not os.path.exists(os.path.join(fpath, "columns.json")):
+        write_chunks(dp.preprocess_csv_chunks(csv_fpath, preprocess, chunksize), fpath,
+                     ROW_ORDER.get(preprocess))
+    return read_columns(fpath)
+
+def write_columns(df: "pandas.DataFrame", fpath: str):
+    """Writes `df` column by column, atomically replacing `fpath`"""
+    write_chunks([df], fpath)
+
+def write_chunks(chunks, fpath: str, sort_by: list = None):
+    """Writes an iterable of dataframes sharing the same columns as one
+    frame, atomically replacing `fpath`, see `ColumnWriter.close`"""
+    parent = os.path.dirname(fpath) or "."
+    os.makedirs(parent, exist_ok=True)
+    tmp_fpath = tempfile.mkdtemp(dir=parent)
+    try:
+        writer = ColumnWriter(tmp_fpath)
+        for chunk in chunks:
+            writer.append(chunk)
+        writer.close(sort_by)
+    except BaseException:
+        shutil.rmtree(tmp_fpath, ignore_errors=True)
+        raise
+
+    if os.path.exists(fpath):
+        shutil.rmtree(fpath)
+    os.replace(tmp_fpath, fpath)
+
+class ColumnWriter:
+    """Appends dataframe chunks to the files `read_columns` loads
+
+    Column kinds and dtypes are fixed by the first non-empty chunk. Values
+    are appended to raw files as they arrive and only get their .npy header
+    on `close`, so no more than one chunk is held in memory.
+    """
+
+    def __init__(self, fpath: str):
+        self.fpath = fpath
+        self.columns = None
+        self.rows = 0
+        self._block_dtype = None
+        self._categories = {}
+        self._raw_files = {}
+
+    def append(self, df: "pandas.DataFrame"):
+        if df.empty:
+            return
+        if self.columns is None:
+            self._start(df)
+        block_columns = [col["name"] for col in self.columns if col["kind"] == "block"]
+        if block_columns:
+            self._write("block.npy", df[block_columns].to_numpy(dtype=self._block_dtype))
+        for col in self.columns:
+            series = df[col["name"]]
+            if col["kind"] == "numeric":
+                self._write(col["file"], series.to_numpy(dtype=col["dtype"]))
+            elif col["kind"] != "block":
+                self._write(col["file"], self._codes(col["name"], series))
+        self.rows += len(df)
+
+    def _start(self, df):
+        float_columns = [col for col in df.columns if df[col].dtype.kind == "f"]
+        if float_columns:
+            # Stored as one 2D block so the loaded frame can wrap it without a copy
+            self._block_dtype = np.result_type(*df[float_columns].dtypes)
+        self.columns = []
+        for i, col in enumerate(df.columns):
+            series = df[col]
+            if col in float_columns:
+                self.columns.append({"name": col, "kind": "block", "dtype": series.dtype.str})
+            elif series.dtype.kind in "biu":
+                self.columns.append({"name": col, "kind": "numeric", "file": f"{i}.npy",
+                                     "dtype": series.dtype.str})
+            else:
+                self.columns.append({
+                    "name": col,
+                    "kind": "category" if series.dtype.name == "category" else "object",
+                    "file": f"{i}.npy",
+                })
+                self._categories[col] = {}
+
+    def _codes(self, name, series):
+        categories = self._categories[name]
+        for value in series.dropna().unique():
+            if value not in categories:
+                categories[value] = len(categories)
+        return series.map(categories).fillna(-1).to_numpy(dtype=np.int32)
+
+    def _write(self, fname, values):
+        if fname not in self._raw_files:
+            self._raw_files[fname] = (open(os.path.join(self.fpath, fname + ".raw"), "wb"),
+                                      values.dtype, values.shape[1:])
+        values.tofile(self._raw_files[fname][0])
+
+    def close(self, sort_by: list = None):
+        """Writes the .npy headers, with the rows stably sorted by the
+        `sort_by` columns if given"""
+        if self.columns is None:
+            raise ValueError("no rows to write")
+        for col in self.columns:
+            if col["kind"] in ("category", "object"):
+                col["categories"] = self._sort_categories(col)
+        for fname, (raw_file, dtype, tail_shape) in self._raw_files.items():
+            raw_file.close()
+            raw_fpath = raw_file.name
+            with open(os.path.join(self.fpath, fname), "wb") as outfile, open(raw_fpath, "rb") as infile:
+                np.lib.format.write_array_header_1_0(outfile, {
+                    "descr": np.lib.format.dtype_to_descr(dtype),
+                    "fortran_order": False,
+                    "shape": (self.rows, *tail_shape),
+                })
+                shutil.copyfileobj(infile, outfile)
+            os.remove(raw_fpath)
+        if sort_by:
+            self._sort_rows(sort_by)
+        np.save(os.path.join(self.fpath, "index.npy"), np.arange(self.rows))
+        with open(os.path.join(self.fpath, "columns.json"), "w") as outjson:
+            json.dump(self.columns, outjson)
+
+    def _sort_rows(self, sort_by):
+        """Reorders the rows of every written file by the `sort_by` columns,
+        a chunk of rows at a time"""
+        files = {col["name"]: col.get("file") for col in self.columns}
+        # Category codes follow the sorted categories, so they sort like the labels
+        keys = [np.load(os.path.join(self.fpath, files[name])) for name in reversed(sort_by)]
+        order = np.lexsort(keys)
+        if (order == np.arange(self.rows)).all():
+            return
+
+        for fname in self._raw_files:
+            fpath = os.path.join(self.fpath, fname)
+            values = np.load(fpath, mmap_mode="r")
+            sorted_fpath = fpath + ".sorted"
+            out = np.lib.format.open_memmap(sorted_fpath, mode="w+", dtype=values.dtype,
+                                            shape=values.shape)
+            for start in range(0, self.rows, dp.CSV_CHUNK_ROWS):
+                out[start:start + dp.CSV_CHUNK_ROWS] = values[order[start:start + dp.CSV_CHUNK_ROWS]]
+            out.flush()
+            del out, values
+            os.replace(sorted_fpath, fpath)
+
+    def _sort_categories(self, col):
+        """Categories in sorted order, as pandas would infer them, with the
+        codes already written remapped to match"""
+        categories = list(self._categories[col["name"]])
+        order = sorted(range(len(categories)), key=lambda i: categories[i])
+        remap = np.empty(len(categories), dtype=np.int32)
+        remap[order] = np.arange(len(categories), dtype=np.int32)
+
+        raw_file = self._raw_files[col["file"]][0]
+        raw_file.flush()
+        if self.rows:
+            codes = np.memmap(raw_file.name, dtype=np.int32, mode="r+")
+            for start in range(0, len(codes), dp.CSV_CHUNK_ROWS):
+                block = codes[start:start + dp.CSV_CHUNK_ROWS]
+                block[block >= 0] = remap[block[block >= 0]]
+            codes.flush()
+            del codes
+        return [categories[i] for i in order]
+
+def read_columns(fpath: str) -> "pandas.DataFrame":
+    """Rebuilds a dataframe written by `write_columns` from memory maps"""
+    with open(os.path.join(fpath, "columns.json")) as injson:
+        columns = json.load(injson)
+    index = np.load(os.path.join(fpath, "index.npy"))
+
+    # Copy-on-write maps: pages are shared until a worker writes to them
+    block_columns = [col for col in columns if col["kind"] == "block"]
+    if block_columns:
+        block = np.load(os.path.join(fpath, "block.npy"), mmap_mode="c")
+        df = pd.DataFrame(block, columns=[col["name"] for col in block_columns],
+                          index=index, copy=False)
+        for col in block_columns:
+            if df[col["name"]].dtype.str != col["dtype"]:
+                df[col["name"]] = df[col["name"]].astype(col["dtype"])
+    else:
+        df = pd.DataFrame(index=index)
+
+    for i, col in enumerate(columns):
+        if col["kind"] == "block":
+            continue
+        values = np.load(os.path.join(fpath, col["file"]), mmap_mode="c")
+        if col["kind"] != "numeric":
+            values = pd.Categorical.from_codes(values, col["categories"])
+            if col["kind"] == "object":
+                values = np.asarray(values, dtype=object)
+        df.insert(i, col["name"], values)
+    return df
@@ -0,0 +1,184 @@
+"""Render static choropleth frames and animations for reports
+
+    python export_frames.py [--levels uk nuts region laua] [--formats jpeg png]
+                            [--animations gif mp4] [--jobs N]
+
+Every year of every map level is rendered with the app's figure builders,
+in parallel across a process pool. Frames whose figure is unchanged since
+the last export are skipped, using the hashes recorded in the output
+directory's manifest. The frames of each map are then assembled into
+animations.
+
+Rendering needs kaleido (0.2.x with plotly 5) and assembling animations
+needs imageio >= 2.28 (plus imageio-ffmpeg for MP4); both are imported
+only when used. Maps are drawn
+without basemap tiles unless --tiles is given, so exports run offline.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.graph_objects as go
+
+import app
+import dataset
+import plotting
+from figure_cache import serialize
+
+OUTPUT_DIR = "exports"
+MANIFEST_FNAME = "manifest.json"
+LEVELS = ["uk", "nuts", "region", "laua"]
+RASTER_FORMATS = ["png", "jpeg", "webp"]
+
+def enumerate_figures(levels, regions):
+    """Yields (map name, year, figure builder) for every frame to export.
+    The memoized builders are used, so prerendered figures are reused."""
+    years = [int(year) for year in dataset.year_marks()]
+    animated = {"uk": app.update_choropleth, "nuts": app.all_regions_choropleth}
+    for level in levels:
+        if level in animated:
+            animation = go.Figure(animated[level]())
+            for year in years:
+                yield level, year, lambda year=year, animation=animation: plotting.figure_frame(animation, str(year))
+    for location in regions:
+        for level, builder in [("region", app.update_region_choropleth),
+                               ("laua", app.update_laua_choropleth)]:
+            if level in levels:
+                for year in years:
+                    yield f"{level}/{location}", year, lambda location=location, year=year, builder=builder: go.Figure(builder(location, year))
+
+def export_figure(figure, year: int, tiles: bool):
+    """The figure as drawn in an export, titled with its year"""
+    figure.update_layout(title_text=str(year))
+    if not tiles:
+        figure.update_layout(mapbox_style="white-bg")
+    return figure
+
+def frame_hash(figure_json: bytes, fmt: str, width: int, height: int) -> str:
+    sha = hashlib.sha256(figure_json)
+    sha.update(f"{fmt}:{width}x{height}".encode())
+    return sha.hexdigest()
+
+def render_frame(figure_json: bytes, fpath: str, fmt: str, width: int, height: int):
+    """Runs in a pool worker"""
+    import plotly.io as pio
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    pio.write_image(json.loads(figure_json), fpath, format=fmt, width=width, height=height)
+    return fpath
+
+def assemble_animation(frame_fpaths, fpath: str, frame_duration: float):
+    """Runs in a pool worker"""
+    import imageio.v2 as imageio
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    frames = [imageio.imread(frame_fpath) for frame_fpath in frame_fpaths]
+    if fpath.endswith(".gif"):
+        # GIFs are written by the pillow plugin, which takes milliseconds
+        imageio.mimsave(fpath, frames, duration=frame_duration * 1000, loop=0)
+    else:
+        with imageio.get_writer(fpath, fps=1 / frame_duration) as writer:
+            for frame in frames:
+                writer.append_data(frame)
+    return fpath
+
+def require(module: str, purpose: str):
+    import importlib.util
+    if importlib.util.find_spec(module) is None:
+        raise SystemExit(f"{purpose} needs the optional {module} package: pip install {module}")
+
+def load_manifest(output_dir):
+    fpath = os.path.join(output_dir, MANIFEST_FNAME)
+    if not os.path.exists(fpath):
+        return {}
+    with open(fpath) as injson:
+        return json.load(injson)
+
+def write_manifest(output_dir, manifest):
+    with open(os.path.join(output_dir, MANIFEST_FNAME), "w") as outjson:
+        json.dump(manifest, outjson, indent=1, sort_keys=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=LEVELS)
+    parser.add_argument("--regions", nargs="*",
+                        help="regions exported at the region and laua levels (default: all)")
+    parser.add_argument("--formats", nargs="+", default=["jpeg"])
+    parser.add_argument("--animations", nargs="*", choices=["gif", "mp4"], default=["gif"])
+    parser.add_argument("--frame-duration", type=float, default=0.5,
+                        help="seconds per year in animations (default: %(default)s)")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--tiles", action="store_true",
+                        help="draw basemap tiles, which need network access")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="re-render unchanged frames")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="list what would be rendered without rendering")
+    args = parser.parse_args()
+
+    regions = args.regions
+    if regions is None:
+        regions = [location for location in dataset.aggregates().regions
+                   if location in dataset.region_index()]
+    animation_formats = [fmt for fmt in args.formats if fmt in RASTER_FORMATS]
+    if not args.dry_run:
+        require("kaleido", "Rendering frames")
+        if args.animations and animation_formats:
+            require("imageio", "Assembling animations")
+
+    start = time.perf_counter()
+    manifest = load_manifest(args.output_dir)
+    new_manifest = {}
+    renders = []
+    animations = {}
+    for name, year, build in enumerate_figures(args.levels, regions):
+        figure_json = serialize(export_figure(build(), year, args.tiles))
+        for fmt in args.formats:
+            fpath = os.path.join(args.output_dir, fmt, name, f"{year}.{fmt}")
+            key = os.path.relpath(fpath, args.output_dir)
+            digest = frame_hash(figure_json, fmt, args.width, args.height)
+            new_manifest[key] = digest
+            if args.force or manifest.get(key) != digest or not os.path.exists(fpath):
+                renders.append((figure_json, fpath, fmt, args.width, args.height))
+            if fmt in animation_formats:
+                animations.setdefault((name, fmt), []).append(fpath)
+
+    assemblies = []
+    for (name, fmt), frame_fpaths in animations.items():
+        for animation_format in args.animations:
+            fpath = os.path.join(args.output_dir, animation_format, f"{name}.{fmt}.{animation_format}")
+            key = os.path.relpath(fpath, args.output_dir)
+            frame_keys = [os.path.relpath(frame_fpath, args.output_dir) for frame_fpath in frame_fpaths]
+            digest = hashlib.sha256(
+                json.dumps([new_manifest[frame_key] for frame_key in frame_keys] + [args.frame_duration]).encode()
+            ).hexdigest()
+            new_manifest[key] = digest
+            if args.force or manifest.get(key) != digest or not os.path.exists(fpath):
+                assemblies.append((frame_fpaths, fpath, args.frame_duration))
+
+    unchanged = len(new_manifest) - len(renders) - len(assemblies)
+    print(f"{len(renders)} frames and {len(assemblies)} animations to render, "
+          f"{unchanged} unchanged")
+    if args.dry_run:
+        for _, fpath, *_ in renders:
+            print(fpath)
+        for _, fpath, _ in assemblies:
+            print(fpath)
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for future in [pool.submit(render_frame, *render) for render in renders]:
+            print(future.result())
+        # Submitted only once every frame is written, as they read them
+        for future in [pool.submit(assemble_animation, *assembly) for assembly in assemblies]:
+            print(future.result())
+    write_manifest(args.output_dir, new_manifest)
+    print(f"Exported {len(renders)} frames and {len(assemblies)} animations "
+          f"in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
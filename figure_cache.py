@@ -0,0 +1,142 @@
+import functools
+import gzip
+import json
+import pickle
+import threading
+import warnings
+from collections import OrderedDict
+
+import plotly
+
+from profiling import phase
+
+class FigureCache:
+    """LRU cache of serialized callback outputs capped by total byte size
+
+    Payloads pinned from a prerendered bundle are kept on top of the cap.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        # Prerendered payloads loaded from a bundle, never evicted
+        self._pinned = {}
+        self._pinned_size = 0
+        self._deferred_bundle = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self._deferred_bundle is not None:
+            self.load_deferred_bundle()
+        with self._lock:
+            payload = self._pinned.get(key)
+            if payload is not None:
+                self.hits += 1
+                return payload
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def set(self, key, payload: bytes):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = payload
+            self._size += len(payload)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "pinned_entries": len(self._pinned),
+                "pinned_bytes": self._pinned_size,
+            }
+
+    def load_bundle(self, fpath: str, version: str) -> bool:
+        """Pin the prerendered payloads of a bundle written by prerender.py
+
+        The bundle is ignored if it was rendered from a different `version`
+        of the dataset and code.
+        """
+        with gzip.open(fpath, "rb") as infile:
+            bundle = pickle.load(infile)
+        if bundle["version"] != version:
+            return False
+        pinned_size = sum(len(payload) for payload in bundle["entries"].values())
+        with self._lock:
+            self._pinned = bundle["entries"]
+            self._pinned_size = pinned_size
+        return True
+
+    def defer_bundle(self, fpath: str, version):
+        """Like `load_bundle` but loaded on the first lookup, `version` being
+        a callable so hashing the dataset is deferred too"""
+        self._deferred_bundle = (fpath, version)
+
+    def load_deferred_bundle(self):
+        """Loads a bundle passed to `defer_bundle` now, if not loaded yet"""
+        with self._lock:
+            deferred, self._deferred_bundle = self._deferred_bundle, None
+        if deferred is not None:
+            fpath, version = deferred
+            if not self.load_bundle(fpath, version()):
+                warnings.warn(f"Ignoring {fpath}, it was rendered from a different release; "
+                              "rerun prerender.py")
+
+    def memoize(self, key=None):
+        """Decorator caching the serialized return value of a callback
+
+        `key` maps the callback arguments to the values that actually
+        determine the output, e.g. the hovered year instead of the whole
+        hoverData dict. Defaults to the arguments themselves.
+        """
+        def decorator(func):
+            def cache_key(*args):
+                key_values = key(*args) if key is not None else args
+                return make_key(func.__name__, key_values)
+
+            @functools.wraps(func)
+            def wrapper(*args):
+                cache_key = wrapper.cache_key(*args)
+                payload = self.get(cache_key)
+                if payload is not None:
+                    return json.loads(payload)
+                result = func(*args)
+                with phase("serialize"):
+                    payload = serialize(result)
+                self.set(cache_key, payload)
+                return result
+            wrapper.cache_key = cache_key
+            return wrapper
+        return decorator
+
+def make_key(name, key_values):
+    return json.dumps([name, key_values], default=str)
+
+def serialize(obj) -> bytes:
+    return json.dumps(obj, cls=plotly.utils.PlotlyJSONEncoder).encode("utf-8")
+
+def write_bundle(fpath: str, version: str, entries: dict):
+    with gzip.open(fpath, "wb") as outfile:
+        pickle.dump({"version": version, "entries": entries}, outfile)
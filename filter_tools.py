@@ -1,13 +1,39 @@
-from pandas import DataFrame
+"""Column selection by energy type
+
+The columns of an energy type are looked up once per column schema in a
+registry of column positions, so filtering is a positional selection.
+"""
+import functools
+
+from pandas import RangeIndex
+
+DESCRIPTIVE_COLUMNS = ["Name", "Year", "Unit"]
+
+class ColumnRegistry:
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.descriptive = [self.columns.index(col) for col in DESCRIPTIVE_COLUMNS
+                            if col in self.columns]
+        self._positions = {}
+
+    def positions(self, energy_type: str):
+        """Positions of the descriptive columns followed by the others whose
+        name contains `energy_type`, case insensitively"""
+        key = energy_type.lower()
+        if key not in self._positions:
+            self._positions[key] = self.descriptive + [
+                i for i, col in enumerate(self.columns)
+                if key in col.lower() and i not in self.descriptive]
+        return self._positions[key]
+
+@functools.lru_cache(maxsize=32)
+def column_registry(columns: tuple) -> ColumnRegistry:
+    return ColumnRegistry(columns)
 
 def filter_energy_type(df, energy_type):
-    descriptive_columns = ["Name", "Year", "Unit"]
-    energy_columns = [col for col in df.columns if energy_type.lower() in col.lower()]
-    all_columns = descriptive_columns + energy_columns
-    series_dict = {}
-    for col in all_columns:
-        try:
-            series_dict[col] = df[col]
-        except KeyError:
-            pass
-    return DataFrame.from_dict(series_dict).reset_index(drop=True)
\ No newline at end of file
+    """The descriptive columns and the columns of `energy_type`"""
+    registry = column_registry(tuple(df.columns))
+    # iloc already copies, so the index is replaced in place
+    filtered = df.iloc[:, registry.positions(energy_type)]
+    filtered.index = RangeIndex(len(filtered))
+    return filtered
@@ -0,0 +1,385 @@
+"""Simplified, quantized GeoJSON geometries for the choropleth maps
+
+Each boundary file is simplified once per zoom level by
+`simplify_geojson.py` and written to SIMPLIFIED_DIR. Rings are split
+into arcs at the points where neighbouring polygons meet and every
+shared arc is simplified once, so adjacent regions keep a common border
+without gaps or overlaps.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+SIMPLIFIED_DIR = "simplified"
+PRECISION = 5
+NODE_CAPACITY = 8
+
+# (name, maximum mapbox zoom, Douglas-Peucker tolerance in degrees)
+ZOOM_LEVELS = [
+    ("low", 4.5, 0.01),
+    ("medium", 7, 0.002),
+    ("high", float("inf"), 0.0005),
+]
+
+GEOJSON_FILES = ["nuts_level_1", "uk", "countries", "laua"]
+
+def zoom_level(zoom: float) -> str:
+    """Name of the simplification level drawn at a mapbox zoom"""
+    for level, max_zoom, _ in ZOOM_LEVELS:
+        if zoom < max_zoom:
+            return level
+    return ZOOM_LEVELS[-1][0]
+
+def simplified_fpath(name: str, level: str) -> str:
+    return os.path.join(SIMPLIFIED_DIR, f"{name}.{level}.geojson")
+
+def load_geojson(name: str, zoom: float = None, level: str = None) -> dict:
+    """Loads the geometry appropriate for `zoom` (or the named `level`),
+    falling back to the full resolution file when no simplified version has
+    been generated"""
+    fpath = f"{name}.geojson"
+    if zoom is not None:
+        level = zoom_level(zoom)
+    if level is not None:
+        level_fpath = simplified_fpath(name, level)
+        if os.path.exists(level_fpath):
+            fpath = level_fpath
+    with open(fpath) as injson:
+        return json.load(injson)
+
+def simplify_geojson(geojson: dict, tolerance: float, precision: int = PRECISION) -> dict:
+    """Returns a copy of a FeatureCollection with quantized coordinates and
+    every shared arc simplified identically"""
+    features = []
+    for feature in geojson["features"]:
+        geom = feature["geometry"]
+        polygons = geom["coordinates"] if geom["type"] == "MultiPolygon" else [geom["coordinates"]]
+        features.append(
+            [[_quantize_ring(ring, precision) for ring in polygon] for polygon in polygons]
+        )
+
+    junctions = _find_junctions(
+        ring for polygons in features for polygon in polygons for ring in polygon
+    )
+    arc_cache = {}
+
+    simplified_features = []
+    for feature, polygons in zip(geojson["features"], features):
+        simplified_polygons = []
+        for polygon in polygons:
+            rings = []
+            for i, ring in enumerate(polygon):
+                simplified = _simplify_ring(ring, junctions, tolerance, arc_cache)
+                if simplified is not None:
+                    rings.append(simplified)
+                elif i == 0:
+                    # Exterior ring vanished at this tolerance, drop its holes too
+                    break
+            if rings:
+                simplified_polygons.append(rings)
+        if not simplified_polygons:
+            continue
+
+        if len(simplified_polygons) == 1:
+            geometry = {"type": "Polygon", "coordinates": simplified_polygons[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": simplified_polygons}
+        simplified_features.append({
+            "type": "Feature",
+            "properties": feature["properties"],
+            "geometry": geometry
+        })
+
+    simplified_geojson = {key: val for key, val in geojson.items() if key != "features"}
+    simplified_geojson["features"] = simplified_features
+    return simplified_geojson
+
+def _quantize_ring(ring, precision):
+    quantized = []
+    for lon, lat, *_ in ring:
+        point = (round(lon, precision), round(lat, precision))
+        if not quantized or quantized[-1] != point:
+            quantized.append(point)
+    if quantized[0] != quantized[-1]:
+        quantized.append(quantized[0])
+    return quantized
+
+def _find_junctions(rings):
+    """Points where an arc shared by two polygons begins or ends"""
+    neighbours = {}
+    for ring in rings:
+        points = ring[:-1]
+        for i, point in enumerate(points):
+            neighbours.setdefault(point, set()).update(
+                (points[i - 1], points[(i + 1) % len(points)]))
+    # A point on a single border has exactly two neighbours; anything else
+    # is where borders meet or diverge
+    return {point for point, adjacent in neighbours.items() if len(adjacent) > 2}
+
+def _simplify_ring(ring, junctions, tolerance, arc_cache):
+    points = ring[:-1]
+    if len(points) < 3:
+        return None
+    cuts = [i for i, point in enumerate(points) if point in junctions]
+    is_island = not cuts
+    if is_island:
+        # Anchor on the lowest point and the point farthest from it so both
+        # sides of a border shared by two junction-free rings agree
+        anchor = min(range(len(points)), key=lambda i: points[i])
+        far = max(range(len(points)), key=lambda i: _sq_dist(points[anchor], points[i]))
+        cuts = sorted({anchor, far})
+
+    simplified = []
+    for start, end in zip(cuts, cuts[1:] + [cuts[0] + len(points)]):
+        arc = [points[i % len(points)] for i in range(start, end + 1)]
+        simplified.extend(_simplify_arc(arc, tolerance, arc_cache)[:-1])
+    simplified.append(simplified[0])
+
+    if len(simplified) < 4:
+        if is_island:
+            return None
+        # Collapsing a ring that shares borders would open a gap
+        simplified = ring
+    return [list(point) for point in simplified]
+
+def _simplify_arc(arc, tolerance, arc_cache):
+    """Douglas-Peucker simplification, cached on the unoriented arc so a
+    border shared by two rings is simplified the same way for both"""
+    reverse = arc[-1] < arc[0] or (arc[-1] == arc[0] and len(arc) > 2 and arc[-2] < arc[1])
+    key = tuple(reversed(arc)) if reverse else tuple(arc)
+    if key not in arc_cache:
+        arc_cache[key] = _douglas_peucker(key, tolerance)
+    simplified = arc_cache[key]
+    return list(reversed(simplified)) if reverse else list(simplified)
+
+def _douglas_peucker(points, tolerance):
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    sq_tolerance = tolerance * tolerance
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = 0, None
+        for i in range(first + 1, last):
+            dist = _sq_segment_dist(points[i], points[first], points[last])
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > sq_tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+def _sq_dist(a, b):
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2
+
+def _sq_segment_dist(point, start, end):
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return _sq_dist(point, start)
+    t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / (dx * dx + dy * dy)
+    t = max(0, min(1, t))
+    return _sq_dist(point, (start[0] + t * dx, start[1] + t * dy))
+
+class GeometryIndex:
+    """Single-feature FeatureCollections keyed by feature properties, with
+    bounding boxes, centroids and a fitted mapbox view precomputed
+
+    Built once per process; under a preloading server the forked workers
+    share it. The geometry of each feature is taken from the simplification
+    level matching the zoom it will be drawn at.
+    """
+
+    def __init__(self, name: str, key_properties, map_height: int = 450):
+        full_geojson = load_geojson(name)
+        levels = {
+            level: self._features_by_objectid(name, level)
+            for level, _, _ in ZOOM_LEVELS
+        }
+        crs = full_geojson.get("crs")
+
+        self._collections = {}
+        self._bounds = {}
+        self._centroids = {}
+        self._zooms = {}
+        self._properties = {}
+        # Every polygon of every feature at full resolution, for point lookups
+        self._keys = []
+        entries = []
+        for feature in full_geojson["features"]:
+            polygons = _polygons(feature["geometry"])
+            bounds = _bounds(polygons)
+            zoom = fit_zoom(bounds, map_height)
+            objectid = feature["properties"]["objectid"]
+            level_feature = levels[zoom_level(zoom)].get(objectid, feature)
+
+            collection = {"type": "FeatureCollection", "features": [level_feature]}
+            if crs is not None:
+                collection["crs"] = crs
+            for prop in key_properties:
+                key = feature["properties"][prop]
+                self._collections[key] = collection
+                self._bounds[key] = bounds
+                self._centroids[key] = _centroid(polygons)
+                self._zooms[key] = zoom
+                self._properties[key] = feature["properties"]
+            key = feature["properties"][key_properties[0]]
+            self._keys.append(key)
+            entries.extend((_bounds([polygon]), (key, _edges(polygon))) for polygon in polygons)
+        self._tree = STRTree(entries)
+
+    @staticmethod
+    def _features_by_objectid(name, level):
+        fpath = simplified_fpath(name, level)
+        if not os.path.exists(fpath):
+            return {}
+        with open(fpath) as injson:
+            geojson = json.load(injson)
+        return {feature["properties"]["objectid"]: feature for feature in geojson["features"]}
+
+    def __contains__(self, key):
+        return key in self._collections
+
+    def collection(self, key) -> dict:
+        return self._collections[key]
+
+    def bounds(self, key):
+        """(min_lon, min_lat, max_lon, max_lat)"""
+        return self._bounds[key]
+
+    def centroid(self, key):
+        """Area weighted centroid as a mapbox {"lat", "lon"} dict"""
+        return self._centroids[key]
+
+    def center(self, key):
+        """Center of the bounding box as a mapbox {"lat", "lon"} dict"""
+        min_lon, min_lat, max_lon, max_lat = self._bounds[key]
+        return {"lat": (min_lat + max_lat) / 2, "lon": (min_lon + max_lon) / 2}
+
+    def zoom(self, key) -> float:
+        return self._zooms[key]
+
+    def properties(self, key) -> dict:
+        return self._properties[key]
+
+    def locate(self, lon: float, lat: float):
+        """Key of the feature containing the point, or None. Only the
+        polygons whose bounding box contains the point are tested."""
+        for key, edges in self._tree.query(lon, lat):
+            if _edges_contain(edges, lon, lat):
+                return key
+        return None
+
+    def nearest(self, lon: float, lat: float):
+        """Key of the feature whose centroid is closest to the point"""
+        return min(
+            self._keys,
+            key=lambda key: _sq_dist((lon, lat), (self._centroids[key]["lon"], self._centroids[key]["lat"]))
+        )
+
+class STRTree:
+    """Static R-tree of bounding boxes packed by Sort-Tile-Recursive
+
+    Entries are sorted into vertical slices by the x of their centers, each
+    slice is sorted by y and cut into nodes of `capacity`, and the nodes are
+    packed the same way until a single level of at most `capacity` remains.
+    """
+
+    def __init__(self, entries, capacity: int = NODE_CAPACITY):
+        """`entries` are (bounds, item) pairs, bounds being
+        (min_x, min_y, max_x, max_y)"""
+        level = list(entries)
+        self.height = 0
+        while len(level) > capacity:
+            level = [(_union(node), node) for node in _str_pack(level, capacity)]
+            self.height += 1
+        self.root = level
+
+    def query(self, x: float, y: float) -> list:
+        """Items whose bounds contain the point"""
+        found = []
+        stack = [(self.height, self.root)]
+        while stack:
+            depth, entries = stack.pop()
+            for (min_x, min_y, max_x, max_y), child in entries:
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    if depth:
+                        stack.append((depth - 1, child))
+                    else:
+                        found.append(child)
+        return found
+
+def _str_pack(entries, capacity):
+    node_count = math.ceil(len(entries) / capacity)
+    slice_size = math.ceil(math.sqrt(node_count)) * capacity
+    by_x = sorted(entries, key=lambda entry: entry[0][0] + entry[0][2])
+    nodes = []
+    for start in range(0, len(by_x), slice_size):
+        by_y = sorted(by_x[start:start + slice_size], key=lambda entry: entry[0][1] + entry[0][3])
+        nodes.extend(by_y[i:i + capacity] for i in range(0, len(by_y), capacity))
+    return nodes
+
+def _union(entries):
+    return (min(bounds[0] for bounds, _ in entries), min(bounds[1] for bounds, _ in entries),
+            max(bounds[2] for bounds, _ in entries), max(bounds[3] for bounds, _ in entries))
+
+def _edges(polygon) -> "numpy.ndarray":
+    """(x0, y0, x1, y1) rows of every edge of a polygon's rings"""
+    edges = []
+    for ring in polygon:
+        points = np.array([point[:2] for point in ring], dtype=float)
+        edges.append(np.hstack([points[:-1], points[1:]]))
+    return np.vstack(edges).T.copy()
+
+def _edges_contain(edges, lon: float, lat: float) -> bool:
+    """Even-odd ray casting over every edge of a polygon's rings, so holes
+    are excluded"""
+    x0, y0, x1, y1 = edges
+    spanning = np.flatnonzero((y0 > lat) != (y1 > lat))
+    x0, y0, x1, y1 = x0[spanning], y0[spanning], x1[spanning], y1[spanning]
+    crossings = np.count_nonzero(lon < x0 + (lat - y0) * (x1 - x0) / (y1 - y0))
+    return bool(crossings % 2)
+
+def fit_zoom(bounds, map_height: int, padding: float = 0.5) -> float:
+    """Mapbox zoom at which `bounds` fit a square map `map_height` pixels tall"""
+    min_lon, min_lat, max_lon, max_lat = bounds
+    lon_fraction = max(max_lon - min_lon, 1e-6) / 360
+    lat_fraction = max(_mercator_y(max_lat) - _mercator_y(min_lat), 1e-6) / (2 * math.pi)
+    zoom = math.log2(map_height / 512 / max(lon_fraction, lat_fraction))
+    return round(zoom - padding, 2)
+
+def _mercator_y(lat):
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+def _polygons(geom):
+    return geom["coordinates"] if geom["type"] == "MultiPolygon" else [geom["coordinates"]]
+
+def _bounds(polygons):
+    lons = [point[0] for polygon in polygons for point in polygon[0]]
+    lats = [point[1] for polygon in polygons for point in polygon[0]]
+    return min(lons), min(lats), max(lons), max(lats)
+
+def _centroid(polygons):
+    area_sum = lon_sum = lat_sum = 0
+    for polygon in polygons:
+        for i, ring in enumerate(polygon):
+            # Shoelace over each ring, holes subtract from the exterior
+            sign = 1 if i == 0 else -1
+            ring_area = ring_lon = ring_lat = 0
+            for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+                cross = x0 * y1 - x1 * y0
+                ring_area += cross
+                ring_lon += (x0 + x1) * cross
+                ring_lat += (y0 + y1) * cross
+            if ring_area == 0:
+                continue
+            weight = sign * abs(ring_area) / ring_area
+            area_sum += weight * ring_area
+            lon_sum += weight * ring_lon
+            lat_sum += weight * ring_lat
+    if area_sum == 0:
+        min_lon, min_lat, max_lon, max_lat = _bounds(polygons)
+        return {"lat": (min_lat + max_lat) / 2, "lon": (min_lon + max_lon) / 2}
+    return {"lat": lat_sum / (3 * area_sum), "lon": lon_sum / (3 * area_sum)}
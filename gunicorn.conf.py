@@ -0,0 +1,22 @@
+"""gunicorn settings sharing one copy of the dataset between workers
+
+    gunicorn app:server
+
+The app is imported and warmed up in the master process, which then forks
+the workers. The preprocessed columns are memory mapped from the dataset
+cache and everything else built at warm-up (aggregates, geometries,
+prerendered figures, the layout) is inherited copy-on-write, so a worker
+starts without loading anything and adds little memory of its own.
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+preload_app = True
+
+def when_ready(server):
+    import app
+    app.warm()
+    # Keep the collector from touching, and so copying, the warmed objects
+    gc.freeze()
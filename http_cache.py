@@ -0,0 +1,144 @@
+"""Compressed, ETag validated responses for the Dash endpoints
+
+The dashboard's responses only change with the dataset and the code, so
+every cacheable response gets a strong ETag hashed from a release version
+and the request itself (path, query string and, for callbacks, the JSON
+body holding the inputs), suffixed with the content coding so each
+encoding has its own validator. A matching If-None-Match is answered with
+304 before the callback runs. Compressed payloads are kept by ETag and
+encoding, so a repeated request is answered from the cache without
+recomputing or recompressing. Either way Dash never sees the request, so
+`on_hit` is told about it.
+
+brotli is used when the client accepts it and the package is installed,
+gzip otherwise.
+"""
+import gzip
+import hashlib
+
+import flask
+
+from figure_cache import FigureCache
+
+CACHEABLE_PATHS = ["_dash-layout", "_dash-dependencies", "_dash-update-component", "api/energy"]
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class ResponseCache:
+    def __init__(self, version, max_bytes: int, on_hit=None):
+        """`version` is a callable returning the release the responses are
+        rendered from, hashed into every ETag. `on_hit` is called with
+        every request answered from the cache."""
+        self.version = version
+        self.payloads = FigureCache(max_bytes)
+        self.not_modified = 0
+        self.on_hit = on_hit
+
+    def init_app(self, server: flask.Flask):
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+
+    def etag(self, request: flask.Request):
+        """Hash of a cacheable request the ETags of its encodings are built
+        from, None for anything else"""
+        path = request.path.rstrip("/")
+        if not any(path.endswith("/" + cacheable) for cacheable in CACHEABLE_PATHS):
+            return None
+        sha = hashlib.sha256(self.version().encode())
+        sha.update(request.path.encode())
+        sha.update(request.query_string)
+        sha.update(request.get_data())
+        return sha.hexdigest()[:32]
+
+    def _before_request(self):
+        request = flask.request
+        etag = self.etag(request)
+        if etag is None:
+            return None
+        flask.g.etag = etag
+        # Payloads too small to compress are sent uncompressed
+        encodings = dict.fromkeys([accepted_encoding(request), "identity"])
+        for encoding in encodings:
+            if encoded_etag(etag, encoding) in request.if_none_match:
+                self.not_modified += 1
+                self._hit(request)
+                return self._not_modified(etag, encoding)
+
+        for encoding in encodings:
+            payload = self.payloads.get((etag, encoding))
+            if payload is not None:
+                break
+        if payload is not None:
+            response = flask.Response(payload, mimetype="application/json")
+            self._set_headers(response, etag, encoding)
+            self._hit(request)
+            return response
+        return None
+
+    def _hit(self, request):
+        if self.on_hit is not None:
+            self.on_hit(request)
+
+    def _after_request(self, response: flask.Response):
+        etag = getattr(flask.g, "etag", None)
+        if (etag is None or response.status_code != 200 or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or response.mimetype != "application/json"):
+            return response
+
+        encoding = accepted_encoding(flask.request)
+        payload = response.get_data()
+        if len(payload) < MIN_COMPRESS_BYTES:
+            encoding = "identity"
+        payload = compress(payload, encoding)
+        self.payloads.set((etag, encoding), payload)
+        response.set_data(payload)
+        self._set_headers(response, etag, encoding)
+        return response
+
+    @staticmethod
+    def _set_headers(response, etag, encoding):
+        response.set_etag(encoded_etag(etag, encoding))
+        # Revalidate every time, the ETag makes that cheap
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+
+    @staticmethod
+    def _not_modified(etag, encoding):
+        response = flask.Response(status=304)
+        response.set_etag(encoded_etag(etag, encoding))
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def stats(self):
+        stats = self.payloads.stats()
+        stats["not_modified"] = self.not_modified
+        return stats
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """Strong ETag of the `encoding` coded response of a request"""
+    return f"{etag}-{encoding}"
+
+def accepted_encoding(request: flask.Request) -> str:
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return "identity"
+
+def compress(payload: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(payload, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(payload, compresslevel=GZIP_LEVEL)
+    return payload
@@ -1,4 +1,5 @@
 import plotly
+import plotly.graph_objects as go
 
 ENERGY_SOURCE_COLORS = {
     "Coal": '#525B76',
@@ -20,5 +21,80 @@ CHOROPLETH_COLORS = {
 
 PLOT_HEIGHT="350px"
 
+UK_MAPBOX_ZOOM = 3.3
+
 places = ["United Kingdom", "Scotland", "Wales", "Northern Ireland", "East Midlands", "East Of England", "London", "North East", "North West", "South East", "South West", "West Midlands", "Yorkshire And The Humber"]
-REGION_COLORS = dict(zip(places, plotly.colors.qualitative.Prism))
\ No newline at end of file
+# Prism has fewer colors than there are places, Safe follows without repeating any
+REGION_COLORS = dict(zip(places, plotly.colors.qualitative.Prism + plotly.colors.qualitative.Safe))
+
+
+def animated_choropleth_mapbox(df, geojson, locations, color, featureidkey, animation_frame,
+                               range_color, color_continuous_scale) -> go.Figure:
+    """Animated choropleth_mapbox whose geometry is only in the base trace
+
+    plotly.express repeats the geojson in every frame. Here each frame
+    carries just its locations, z values and hover labels, which plotly.js
+    merges into the base trace when animating.
+    """
+    def frame_trace(frame_value, frame_df):
+        return go.Choroplethmapbox(
+            locations=frame_df[locations].tolist(),
+            z=frame_df[color].tolist(),
+            hovertemplate=f"{animation_frame}={frame_value}<br>{locations}=%{{location}}"
+                          f"<br>{color}=%{{z}}<extra></extra>",
+        )
+
+    frames = [(str(value), frame_trace(value, frame_df))
+              for value, frame_df in df.groupby(animation_frame, sort=True)]
+    base_trace = go.Choroplethmapbox(frames[0][1])
+    base_trace.update(geojson=geojson, featureidkey=featureidkey, coloraxis="coloraxis",
+                      name="", subplot="mapbox")
+
+    fig = go.Figure(data=[base_trace],
+                    frames=[go.Frame(name=name, data=[trace]) for name, trace in frames])
+    fig.update_layout(
+        coloraxis={"colorscale": color_continuous_scale, "cmin": range_color[0],
+                   "cmax": range_color[1], "colorbar": {"title": {"text": color}}},
+        mapbox={"domain": {"x": [0, 1], "y": [0, 1]}},
+        margin={"t": 60},
+        updatemenus=[_animation_buttons()],
+        sliders=[_animation_slider([name for name, _ in frames], animation_frame)],
+    )
+    return fig
+
+def figure_frame(fig: go.Figure, name: str) -> go.Figure:
+    """Static copy of an animated figure showing frame `name` only"""
+    frame = next(frame for frame in fig.frames if frame.name == name)
+    static = go.Figure(fig)
+    static.frames = []
+    static.layout.sliders = ()
+    static.layout.updatemenus = ()
+    for trace, frame_trace in zip(static.data, frame.data):
+        frame_values = frame_trace.to_plotly_json()
+        frame_values.pop("type", None)
+        trace.update(frame_values)
+    return static
+
+def _animation_args(duration):
+    return {"frame": {"duration": duration, "redraw": True}, "mode": "immediate",
+            "fromcurrent": True, "transition": {"duration": duration, "easing": "linear"}}
+
+def _animation_buttons():
+    """Play and stop buttons laid out as plotly.express does"""
+    return {
+        "type": "buttons", "direction": "left", "showactive": False,
+        "x": 0.1, "xanchor": "right", "y": 0, "yanchor": "top", "pad": {"r": 10, "t": 70},
+        "buttons": [
+            {"label": "&#9654;", "method": "animate", "args": [None, _animation_args(500)]},
+            {"label": "&#9724;", "method": "animate", "args": [[None], _animation_args(0)]},
+        ],
+    }
+
+def _animation_slider(frame_names, prefix):
+    return {
+        "active": 0, "len": 0.9, "pad": {"b": 10, "t": 60},
+        "x": 0.1, "xanchor": "left", "y": 0, "yanchor": "top",
+        "currentvalue": {"prefix": f"{prefix}="},
+        "steps": [{"label": name, "method": "animate", "args": [[name], _animation_args(0)]}
+                  for name in frame_names],
+    }
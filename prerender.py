@@ -0,0 +1,87 @@
+"""Render every figure the dashboard can show into a bundle app.py serves from
+
+The dataset is static so the inputs of every figure callback can be
+enumerated ahead of time. Run this at deploy time, after the dataset,
+the code or the geometry changes; app.py ignores a bundle rendered from
+another version of any of them:
+
+    python prerender.py
+"""
+import argparse
+import sys
+import time
+
+import app
+import dataset
+import plotting
+from figure_cache import serialize, write_bundle
+
+AXIS_TYPES = ["Linear", "Log"]
+
+def enumerate_inputs():
+    """Yields (callback, args) for every reachable input of every figure"""
+    years = [int(year) for year in dataset.year_marks()]
+    regions = [place for place in plotting.places if place in dataset.aggregates().regions]
+    hovers = [{"points": [{"x": year}]} for year in years]
+
+    for func in [app.update_choropleth, app.all_regions_choropleth, app.uk_total_time_series,
+                 app.uk_total_per_energy_source, app.all_regional_line_plot]:
+        yield func, ()
+    for hoverData in hovers:
+        for func in [app.total_uk_energy_bar_plot, app.update_graph_percent,
+                     app.update_graph, app.update_percent_circle]:
+            yield func, (hoverData,)
+    for axis_type in AXIS_TYPES:
+        yield app.total_uk_energy_time_series, (axis_type,)
+    for first in years:
+        for last in years[years.index(first):]:
+            for statistic in app.RANGE_STATISTICS:
+                for func in [app.year_range_choropleth, app.year_range_bar, app.year_range_pie]:
+                    yield func, (first, last, statistic)
+    for location in regions:
+        for func in [app.update_region_bar, app.uk_region_time_series,
+                     app.update_cum_rate_of_change]:
+            yield func, (location,)
+        for axis_type in AXIS_TYPES:
+            yield app.update_region_line, (location, axis_type)
+        for year in years:
+            yield app.update_region_choropleth, (location, year)
+            yield app.update_laua_choropleth, (location, year)
+            yield app.laua_energy_bar_plot, (location, year)
+        for hoverData in hovers:
+            yield app.region_energy_bar_plot, (location, hoverData)
+            yield app.update_region_percent_circle, (location, hoverData)
+
+def render_bundle():
+    """(entries, failures) of every enumerated figure, failures being the
+    callback calls that raised"""
+    entries, failures = {}, []
+    for func, args in enumerate_inputs():
+        try:
+            figure = func.__wrapped__(*args)
+        except Exception as error:
+            print(f"Failed {func.__name__}{args}: {error!r}", file=sys.stderr)
+            failures.append((func.__name__, args))
+            continue
+        entries[func.cache_key(*args)] = serialize(figure)
+    return entries, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=app.FIGURE_BUNDLE_FPATH,
+                        help="bundle file path (default: %(default)s)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    entries, failures = render_bundle()
+    if failures:
+        # A broken figure must fail the deploy rather than ship without it
+        sys.exit(f"{len(failures)} figures failed to render, no bundle written")
+    write_bundle(args.output, app.figures_version(), entries)
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(len(payload) for payload in entries.values())
+    print(f"Rendered {len(entries)} figures ({total_bytes / 1e6:.1f} MB) "
+          f"to {args.output} in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Per-callback latency instrumentation
+
+Every registered callback is timed end to end and the time is split into
+
+- transform: pandas/data_processing work in the callback body
+- figure: time spent inside plotly.express figure constructors
+- serialize: JSON encoding of the response by Dash and the figure cache
+
+along with call counts and response payload sizes. Rolling percentiles
+are kept over the most recent calls of each callback.
+
+Requests http_cache.ResponseCache answers before Dash runs the callback
+are counted as cache_hits and excluded from the calls and percentiles,
+which only cover callback executions.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+import flask
+from dash.exceptions import PreventUpdate
+
+FIGURE_FUNCTIONS = ["bar", "line", "pie", "scatter", "area", "choropleth_mapbox"]
+PERCENTILES = [50, 95, 99]
+
+_local = threading.local()
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Attributes the time spent in the block to `name` for the callback
+    being profiled on this thread. A no-op when nothing is being profiled."""
+    record = getattr(_local, "record", None)
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record[name] += time.perf_counter() - start
+
+def timed(func, name: str):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+class CallbackStats:
+    def __init__(self, window: int):
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.samples = deque(maxlen=window)
+        self.phase_totals = defaultdict(float)
+        self.payload_bytes = 0
+        self.max_payload_bytes = 0
+
+    def add(self, elapsed, phases, payload_bytes):
+        self.calls += 1
+        self.samples.append(elapsed)
+        for name, value in phases.items():
+            self.phase_totals[name] += value
+        self.payload_bytes += payload_bytes
+        self.max_payload_bytes = max(self.max_payload_bytes, payload_bytes)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        summary = {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "mean_ms": 1000 * sum(samples) / len(samples) if samples else None,
+        }
+        for percentile in PERCENTILES:
+            summary[f"p{percentile}_ms"] = 1000 * _percentile(samples, percentile) if samples else None
+        calls = max(self.calls, 1)
+        for name, total in self.phase_totals.items():
+            summary[f"{name}_mean_ms"] = 1000 * total / calls
+        summary["mean_payload_bytes"] = self.payload_bytes / calls
+        summary["max_payload_bytes"] = self.max_payload_bytes
+        return summary
+
+class CallbackProfiler:
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def wrap_body(self, func):
+        """Times a callback function itself, before Dash serializes its output"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record = getattr(_local, "record", None)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if record is not None:
+                    record["body"] += time.perf_counter() - start
+        return wrapper
+
+    def instrument(self, app, report_fpath: str = None):
+        """Wraps every callback registered on `app`, serves the report at
+        /_callback-metrics and writes it to `report_fpath` on exit"""
+        import plotly.express as px
+        for name in FIGURE_FUNCTIONS:
+            func = getattr(px, name)
+            if not hasattr(func, "__wrapped__"):
+                setattr(px, name, timed(func, "figure"))
+
+        for output, entry in app.callback_map.items():
+            # Clientside callbacks run in the browser and have nothing to time
+            if "callback" in entry:
+                entry["callback"] = self._wrap_response(output, entry["callback"])
+
+        app.server.add_url_rule("/_callback-metrics", "callback_metrics",
+                                lambda: flask.jsonify(self.report()))
+        if report_fpath is not None:
+            atexit.register(self.dump, report_fpath)
+
+    def _wrap_response(self, output, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _local.record = record = defaultdict(float)
+            start = time.perf_counter()
+            try:
+                response = func(*args, **kwargs)
+            except Exception as error:
+                if not isinstance(error, PreventUpdate):
+                    with self._lock:
+                        self._get(output).errors += 1
+                raise
+            finally:
+                _local.record = None
+            elapsed = time.perf_counter() - start
+
+            body = record.pop("body", elapsed)
+            serialize = elapsed - body + record["serialize"]
+            phases = {
+                "transform": body - record["figure"] - record["serialize"],
+                "figure": record["figure"],
+                "serialize": serialize,
+            }
+            with self._lock:
+                self._get(output).add(elapsed, phases, _payload_bytes(response))
+            return response
+        return wrapper
+
+    def record_cache_hit(self, request: flask.Request):
+        """Counts a callback request answered from the response cache"""
+        if not request.path.endswith("_dash-update-component"):
+            return
+        output = (request.get_json(silent=True) or {}).get("output")
+        if output is not None:
+            with self._lock:
+                self._get(output).cache_hits += 1
+
+    def _get(self, output):
+        if output not in self._stats:
+            self._stats[output] = CallbackStats(self.window)
+        return self._stats[output]
+
+    def report(self):
+        with self._lock:
+            return {output: stats.summary() for output, stats in self._stats.items()}
+
+    def dump(self, fpath: str):
+        report = self.report()
+        with open(fpath, "w") as outjson:
+            json.dump(report, outjson, indent=2)
+        print(format_report(report))
+
+def format_report(report) -> str:
+    lines = [f"{'callback output':<60}{'calls':>7}{'cached':>8}{'p50 ms':>9}{'p95 ms':>9}"
+             f"{'transform':>11}{'figure':>9}{'serialize':>11}{'KB':>9}"]
+    ranked = sorted(report.items(), key=lambda item: item[1]["p95_ms"] or 0, reverse=True)
+    for output, summary in ranked:
+        if not summary["calls"]:
+            if summary["cache_hits"]:
+                lines.append(f"{output[:59]:<60}{0:>7}{summary['cache_hits']:>8}")
+            continue
+        lines.append(
+            f"{output[:59]:<60}{summary['calls']:>7}{summary['cache_hits']:>8}{summary['p50_ms']:>9.1f}"
+            f"{summary['p95_ms']:>9.1f}{summary.get('transform_mean_ms', 0):>11.1f}"
+            f"{summary.get('figure_mean_ms', 0):>9.1f}{summary.get('serialize_mean_ms', 0):>11.1f}"
+            f"{summary['mean_payload_bytes'] / 1024:>9.1f}"
+        )
+    return "\n".join(lines)
+
+def _percentile(samples, percentile):
+    index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+    return samples[index]
+
+def _payload_bytes(response):
+    if isinstance(response, (str, bytes)):
+        return len(response)
+    if isinstance(response, flask.Response):
+        return response.calculate_content_length() or 0
+    return 0
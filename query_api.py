@@ -0,0 +1,141 @@
+"""Read-only JSON query API over the energy dataset
+
+    GET /api/energy?level=region&region=Wales&fuel=Gas&year_from=2010&year_to=2015
+
+- level: "uk" (UK totals), "region" (NUTS level 1 regions, the default) or
+  "laua" (local authorities)
+- region: any of plotting.places, repeated or comma separated. "United
+  Kingdom" or no region selects every region.
+- fuel: any of ENERGY_TYPES, repeated or comma separated, selects that
+  fuel's columns. No fuel selects every column.
+- year_from, year_to: inclusive year range
+- offset, limit: pagination, at most MAX_LIMIT rows per page
+
+Queries are answered from an index built once per process: the rows of
+every level sorted by region then year, so a region and year range is a
+contiguous span found by binary search. Responses are cached, compressed
+and ETag validated by http_cache.ResponseCache.
+"""
+import numpy as np
+
+from data_processing import ENERGY_TYPES
+from filter_tools import column_registry
+
+LEVELS = ["uk", "region", "laua"]
+UK = "United Kingdom"
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+VALUE_DECIMALS = 3
+
+class QueryError(ValueError):
+    pass
+
+class LevelTable:
+    """Rows of one aggregation level sorted by region, year and the
+    remaining label columns, with the row span of every region"""
+
+    def __init__(self, df: "pandas.DataFrame", label_columns: list):
+        df = df.sort_values(["Region", "Year"] + [
+            col for col in label_columns if col not in ("Region", "Year")])
+        self.label_columns = label_columns
+        self.value_columns = [col for col in df.columns
+                              if col not in label_columns and col not in ("Region", "Unit")]
+        self.unit = ", ".join(df["Unit"].astype(str).unique())
+        self.labels = list(zip(*(df[col].tolist() for col in label_columns)))
+        self.values = df[self.value_columns].to_numpy("float64").round(VALUE_DECIMALS)
+        self.years = df["Year"].to_numpy()
+
+        regions = df["Region"].astype(str).to_numpy()
+        starts = np.flatnonzero(np.r_[True, regions[1:] != regions[:-1]])
+        stops = np.r_[starts[1:], len(regions)]
+        self.spans = {regions[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+    def rows(self, regions, year_from, year_to) -> "numpy.ndarray":
+        """Row numbers of `regions` between the years, in index order"""
+        ranges = []
+        for start, stop in sorted(self.spans[region] for region in regions):
+            years = self.years[start:stop]
+            ranges.append(np.arange(start + np.searchsorted(years, year_from, "left"),
+                                    start + np.searchsorted(years, year_to, "right")))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=int)
+
+    def columns(self, fuels) -> list:
+        """Positions of the value columns of `fuels`, in column order"""
+        if not fuels:
+            return list(range(len(self.value_columns)))
+        registry = column_registry(tuple(self.value_columns))
+        return sorted({i for fuel in fuels for i in registry.positions(fuel)})
+
+class QueryIndex:
+    def __init__(self, region_df, laua_df, laua_regions: dict):
+        """`laua_regions` maps each LAUA code to the region containing it"""
+        uk_df = region_df.groupby(["Year", "Unit"], observed=True).sum(numeric_only=True)
+        self.tables = {
+            "uk": LevelTable(uk_df.reset_index().assign(Region=UK), ["Year"]),
+            "region": LevelTable(region_df.rename(columns={"Name": "Region"}), ["Region", "Year"]),
+            "laua": LevelTable(laua_df.assign(Region=laua_df["Code"].map(laua_regions)),
+                               ["Region", "Code", "Name", "Year"]),
+        }
+        self.year_range = (int(region_df["Year"].min()), int(region_df["Year"].max()))
+
+    def query(self, level="region", regions=(), fuels=(), year_from=None, year_to=None,
+              offset=0, limit=DEFAULT_LIMIT) -> dict:
+        if level not in self.tables:
+            raise QueryError(f"level must be one of {', '.join(LEVELS)}")
+        table = self.tables[level]
+
+        regions = [region for region in regions if region != UK or level == "uk"]
+        unknown = [region for region in regions if region not in table.spans]
+        if unknown:
+            raise QueryError(f"unknown region {unknown[0]!r} at level {level!r}")
+        unknown = [fuel for fuel in fuels if fuel.lower() not in map(str.lower, ENERGY_TYPES)]
+        if unknown:
+            raise QueryError(f"fuel must be one of {', '.join(ENERGY_TYPES)}")
+
+        year_from = self.year_range[0] if year_from is None else year_from
+        year_to = self.year_range[1] if year_to is None else year_to
+        rows = table.rows(regions or table.spans, year_from, year_to)
+        page = rows[offset:offset + limit]
+        columns = table.columns(fuels)
+        values = table.values[np.ix_(page, columns)].tolist()
+        return {
+            "level": level,
+            "unit": table.unit,
+            "columns": table.label_columns + [table.value_columns[i] for i in columns],
+            "rows": [list(table.labels[row]) + row_values
+                     for row, row_values in zip(page.tolist(), values)],
+            "total": len(rows),
+            "offset": offset,
+            "limit": limit,
+            "next_offset": offset + limit if offset + limit < len(rows) else None,
+        }
+
+def parse_args(args) -> dict:
+    """Keyword arguments of QueryIndex.query from the request's query string"""
+    def listed(name):
+        return [value.strip() for arg in args.getlist(name) for value in arg.split(",")
+                if value.strip()]
+
+    def integer(name, default=None, minimum=None, maximum=None):
+        value = args.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise QueryError(f"{name} must be an integer") from None
+        if minimum is not None and value < minimum:
+            raise QueryError(f"{name} must be at least {minimum}")
+        if maximum is not None and value > maximum:
+            raise QueryError(f"{name} must be at most {maximum}")
+        return value
+
+    return {
+        "level": args.get("level", "region"),
+        "regions": listed("region"),
+        "fuels": listed("fuel"),
+        "year_from": integer("year_from"),
+        "year_to": integer("year_to"),
+        "offset": integer("offset", 0, minimum=0),
+        "limit": integer("limit", DEFAULT_LIMIT, minimum=1, maximum=MAX_LIMIT),
+    }
@@ -0,0 +1,36 @@
+"""Writes zoom-appropriate simplified versions of the GeoJSON boundary files
+
+    python simplify_geojson.py [name ...]
+
+Re-run whenever a source .geojson file changes.
+"""
+import argparse
+import json
+import os
+import time
+
+import geometry
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", default=geometry.GEOJSON_FILES,
+                        help="GeoJSON files to simplify (default: all)")
+    args = parser.parse_args()
+
+    os.makedirs(geometry.SIMPLIFIED_DIR, exist_ok=True)
+    for name in args.names:
+        with open(f"{name}.geojson") as injson:
+            geojson = json.load(injson)
+        source_bytes = os.path.getsize(f"{name}.geojson")
+        for level, _, tolerance in geometry.ZOOM_LEVELS:
+            start = time.perf_counter()
+            simplified = geometry.simplify_geojson(geojson, tolerance)
+            fpath = geometry.simplified_fpath(name, level)
+            with open(fpath, "w") as outjson:
+                json.dump(simplified, outjson, separators=(",", ":"))
+            elapsed = time.perf_counter() - start
+            print(f"{fpath}: {source_bytes:,} -> {os.path.getsize(fpath):,} bytes "
+                  f"({elapsed:.1f}s)")
+
+if __name__ == "__main__":
+    main()